@@ -0,0 +1,62 @@
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.types import Message, Receive, Scope, Send
+
+# 形式自体が圧縮済みのファイル(gzip、zstd圧縮の Apache Arrow)
+COMPRESSED_MEDIA_TYPES = {"application/gzip", "application/vnd.apache.arrow.file"}
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Accept-Encoding が gzip を受け付けるか(q=0 は受け付けないものとして扱う)"""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        (coding, _, params) = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            (name, _, value) = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    if "gzip" in qualities:
+        return qualities["gzip"] > 0
+    return qualities.get("*", 0) > 0
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """圧縮しても小さくならない、または圧縮してはならないレスポンスを除いて gzip 圧縮する
+
+    画像データ、圧縮形式のファイル、部分取得(206)、圧縮済み(Content-Encoding 指定あり)の
+    レスポンスはそのまま返却する。
+    (部分取得を圧縮すると Content-Range が示す範囲と本文が一致しなくなる)
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            if accepts_gzip(headers.get("Accept-Encoding", "")):
+                responder = SelectiveGZipResponder(self.app, self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class SelectiveGZipResponder(GZipResponder):
+    passthrough = False
+
+    async def send_with_gzip(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "").split(";")[0].strip()
+            self.passthrough = (
+                message["status"] == 206
+                or "content-encoding" in headers
+                or media_type.startswith("image/")
+                or media_type in COMPRESSED_MEDIA_TYPES
+            )
+        if self.passthrough:
+            await self.send(message)
+            return
+        await super().send_with_gzip(message)
@@ -1,16 +1,720 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
+
+from app.cache import TTLCache
+from app.client_config import ModelMeta
+from app.custom_logging import CustomLogger
+from app.models import repository
+from app.models.connection import (
+    BATCH_GET_MAX_ITEMS,
+    BATCH_WRITE_MAX_ITEMS,
+    TRANSACT_WRITE_MAX_ITEMS,
+    connection,
+    transact_write,
+)
+from app.models.dog_model import DogModel
+from app.models.event_model import EventModel
+from app.models.event_stat_model import EventStatModel
 from app.models.owner_model import OwnerModel
-from fastapi import Path, status
+from app.models.task_model import TaskModel
+from app.models.unique_model import UniqueModel
+from fastapi import Depends, Path, Query, Request, Response, status
 from fastapi.exceptions import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pynamodb.attributes import Attribute
+from pynamodb.constants import (
+    ALL_OLD,
+    BATCH_GET_ITEM,
+    DELETE_REQUEST,
+    ITEM,
+    KEY,
+    KEYS,
+    PROJECTION_EXPRESSION,
+    PUT_REQUEST,
+    REQUEST_ITEMS,
+    RESPONSES,
+    UNPROCESSED_KEYS,
+)
+from pynamodb.expressions.condition import Condition
+from pynamodb.exceptions import (
+    GetError,
+    PutError,
+    PynamoDBException,
+    TransactWriteError,
+    UpdateError,
+)
+from pynamodb.indexes import Index
+from pynamodb.models import BatchWrite, Model
+
+T = TypeVar("T")
+# 表示順(order)を持つモデル、ETag用の更新回数(version)を持つモデル
+Ordered = TypeVar("Ordered", DogModel, TaskModel)
+Versioned = TypeVar("Versioned", DogModel, TaskModel, EventModel)
+
+logger = CustomLogger.getApplicationLogger()
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NEXT_CURSOR_RESPONSE = {
+    "headers": {
+        NEXT_CURSOR_HEADER: {
+            "description": "次ページ取得用のカーソル、続きが無い場合は返却されない",
+            "schema": {"type": "string"},
+        }
+    }
+}
+
+CACHE_CONTROL = "private, no-cache"
+NOT_MODIFIED_RESPONSE = {"description": "If-None-Match に指定したETagと一致する場合、本文なしで返却"}
+
+OWNER_CACHE_NEGATIVE_TTL = float(os.environ.get("OWNER_CACHE_NEGATIVE_TTL", 10))
+
+owner_cache = TTLCache(
+    maxsize=int(os.environ.get("OWNER_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("OWNER_CACHE_TTL", 300)),
+)
+
+reference_cache = TTLCache(
+    maxsize=int(os.environ.get("REFERENCE_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("REFERENCE_CACHE_TTL", 60)),
+)
 
 
-def owner_id_parameter(
+def owner_id_path(
     owner_id: str = Path(..., regex="^[a-z0-9]{32}$", description="オーナーID")
-):
+) -> str:
+    return owner_id
+
+
+def owner_id_parameter(owner_id: str = Depends(owner_id_path)) -> str:
+    check_owner(owner_id)
+    return owner_id
+
+
+def check_owner(owner_id: str) -> None:
+    exists = owner_cache.get(owner_id)
+    if exists is None:
+        exists = is_owner_exists(owner_id)
+        cache_owner(owner_id, exists)
+    if not exists:
+        raise_owner_not_found()
+
+
+async def check_owner_async(owner_id: str) -> None:
+    exists = owner_cache.get(owner_id)
+    if exists is None:
+        found = await repository.run(is_owner_exists, owner_id)
+        cache_owner(owner_id, found)
+        exists = found
+    if not exists:
+        raise_owner_not_found()
+
+
+def cache_owner(owner_id: str, exists: bool) -> None:
+    owner_cache.set(owner_id, exists, ttl=None if exists else OWNER_CACHE_NEGATIVE_TTL)
+
+
+def raise_owner_not_found() -> None:
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="owner not found.",
+    )
+
+
+def limit_parameter(
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="1ページあたりの最大取得件数"),
+) -> Optional[int]:
+    return limit
+
+
+def cursor_parameter(
+    owner_id: str = Depends(owner_id_path),
+    cursor: Optional[str] = Query(None, description="前ページのレスポンスヘッダ X-Next-Cursor の値"),
+) -> Optional[Dict[str, Any]]:
+    if cursor is None:
+        return None
+
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        key = None
+    if (
+        not isinstance(key, dict)
+        or not all(isinstance(x, dict) for x in key.values())
+        or key.get("owner_id") != {"S": owner_id}
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="illegal cursor.",
+        )
+    return key
+
+
+def set_next_cursor(response: Response, key: Optional[Dict[str, Any]]) -> None:
+    if key is None:
+        return
+    cursor = base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+    response.headers[NEXT_CURSOR_HEADER] = cursor
+
+
+def fields_parameter(
+    response_class: Type[BaseModel],
+) -> Callable[..., Optional[List[str]]]:
+    names = [*response_class.__fields__.keys()]
+
+    def parameter(
+        fields: Optional[str] = Query(
+            None,
+            description=f"取得する項目をカンマ区切りで指定 ({','.join(names)})",
+        ),
+    ) -> Optional[List[str]]:
+        if fields is None:
+            return None
+
+        values = [x.strip() for x in fields.split(",") if x.strip()]
+        if not values or any(x not in names for x in values):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="illegal fields.",
+            )
+        return values
+
+    return parameter
+
+
+def projection(
+    fields: Optional[List[str]], id_attribute: str, *required: str
+) -> Optional[List[str]]:
+    if fields is None:
+        return None
+    names = ["owner_id", id_attribute, *required, *fields]
+    return sorted({x for x in names if x != "id"})
+
+
+def select_fields(model: Model, fields: List[str], id_attribute: str) -> Dict[str, Any]:
+    values = {}
+    for field in fields:
+        value = getattr(model, id_attribute if field == "id" else field)
+        if value is not None:
+            values[field] = value
+    return values
+
+
+def fields_response(response: Response, content: Any) -> JSONResponse:
+    return JSONResponse(content=content, headers=dict(response.headers))
+
+
+def resource_etag(version: int) -> str:
+    return f'W/"{version}"'
+
+
+def list_etag(request: Request, items: Iterable[Tuple[Any, ...]]) -> str:
+    digest = hashlib.sha1(request.url.query.encode())
+    for item in items:
+        digest.update(f"{item}\n".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def check_etag(request: Request, response: Response, etag: str) -> Optional[Response]:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    tags = [x.strip() for x in if_none_match.split(",")]
+    if "*" not in tags and opaque_tag(etag) not in [opaque_tag(x) for x in tags]:
+        return None
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED, headers=dict(response.headers)
+    )
+
+
+def opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        return int(opaque_tag(if_match.strip()).strip('"'))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="precondition failed.",
+        )
+
+
+def patch_actions(
+    model_class: Type[Versioned], changes: Dict[str, Any], updated_at: int
+) -> List[Any]:
+    attributes = model_class.get_attributes()
+    actions = [
+        attributes["updated_at"].set(updated_at),
+        attributes["version"].add(1),
+    ]
+    for (key, value) in changes.items():
+        if value is not None:
+            actions.append(attributes[key].set(value))
+        elif attributes[key].null:
+            actions.append(attributes[key].remove())
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{key} is required.",
+            )
+    return actions
+
+
+def update_item(
+    model: Versioned,
+    range_key: Attribute,
+    changes: Dict[str, Any],
+    if_match: Optional[str],
+    detail: str,
+) -> Versioned:
+    model_class = type(model)
+    expected = parse_if_match(if_match)
+    updated_at = int(datetime.timestamp(datetime.now()))
+    actions = patch_actions(model_class, changes, updated_at)
+
+    condition = range_key.exists()
+    if expected is not None:
+        condition &= version_condition(model_class, expected)
+    try:
+        data = connection.update_item(
+            model_class.Meta.table_name,
+            model.owner_id,
+            range_key=getattr(model, attribute_name(range_key)),
+            actions=actions,
+            condition=condition,
+            return_values=ALL_OLD,
+        )
+    except UpdateError as e:
+        if not is_condition_failed(e):
+            raise e
+        if not is_item_exists(
+            model_class, model.owner_id, getattr(model, attribute_name(range_key))
+        ):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="precondition failed.",
+        )
+
+    # 更新前の値(ALL_OLD)に変更内容を適用し、更新後の状態を復元する
+    previous = model_class.from_raw_data(data["Attributes"])
+    for (key, value) in previous.attribute_values.items():
+        setattr(model, key, value)
+    for (key, value) in changes.items():
+        setattr(model, key, value)
+    model.updated_at = updated_at
+    model.version = previous.version + 1
+    return previous
+
+
+def update_unique_item(
+    model: Ordered,
+    range_key: Attribute,
+    changes: Dict[str, Any],
+    if_match: Optional[str],
+    unique: UniqueModel,
+    previous: UniqueModel,
+    detail: str,
+) -> None:
+    model_class = type(model)
+    expected = parse_if_match(if_match)
+    if expected is not None and expected != model.version:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="precondition failed.",
+        )
+
+    updated_at = int(datetime.timestamp(datetime.now()))
+    actions = patch_actions(model_class, changes, updated_at)
+    condition = range_key.exists() & version_condition(model_class, model.version)
+    try:
+        with transact_write() as transaction:
+            transaction.update(model, actions=actions, condition=condition)
+            if unique.id != previous.id:
+                transaction.delete(previous)
+                transaction.save(unique, condition=UniqueModel.id.does_not_exist())
+    except TransactWriteError as e:
+        if not is_condition_failed(e):
+            raise e
+        if unique.id != previous.id and is_item_exists(UniqueModel, unique.id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=detail,
+            )
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="precondition failed.",
+        )
+
+    for (key, value) in changes.items():
+        setattr(model, key, value)
+    model.updated_at = updated_at
+    model.version += 1
+
+
+def version_condition(model_class: Type[Versioned], version: int) -> Condition:
+    # version の追加前に登録されたアイテムは属性を持たないため、0 として扱う
+    if version == 0:
+        return model_class.version.does_not_exist() | (model_class.version == 0)
+    return model_class.version == version
+
+
+def is_item_exists(
+    model_class: Type[Model], hash_key: str, range_key: Optional[str] = None
+) -> bool:
+    try:
+        model_class.get(hash_key=hash_key, range_key=range_key)
+    except model_class.DoesNotExist:
+        return False
+    return True
+
+
+def valid_references(
+    owner_id: str, dog_ids: Set[str], task_ids: Set[str]
+) -> Tuple[Set[str], Set[str]]:
+    cached_dogs: FrozenSet[str] = reference_cache.get(("dog", owner_id)) or frozenset()
+    cached_tasks: FrozenSet[str] = (
+        reference_cache.get(("task", owner_id)) or frozenset()
+    )
+
+    missing_dogs = dog_ids - cached_dogs
+    missing_tasks = task_ids - cached_tasks
+    if missing_dogs or missing_tasks:
+        try:
+            (found_dogs, found_tasks) = batch_get_ids(
+                owner_id,
+                (DogModel, DogModel.dog_id, missing_dogs),
+                (TaskModel, TaskModel.task_id, missing_tasks),
+            )
+        except GetError as e:
+            # 取得できなかったIDを存在しないものとして扱わず、再試行を促す
+            logger.warning(f"failed to verify references: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="references could not be verified.",
+            )
+        if found_dogs:
+            cached_dogs = cached_dogs | found_dogs
+            reference_cache.set(("dog", owner_id), cached_dogs)
+        if found_tasks:
+            cached_tasks = cached_tasks | found_tasks
+            reference_cache.set(("task", owner_id), cached_tasks)
+
+    return (dog_ids & cached_dogs, task_ids & cached_tasks)
+
+
+def attribute_name(attribute: Attribute) -> str:
+    # モデルに定義した属性は、クラスの生成時に必ず名前が設定される
+    return cast(str, attribute.attr_name)
+
+
+def failed_operations(batch: BatchWrite) -> List[Dict[str, Any]]:
+    # リトライ後も未処理だった操作(型定義には含まれていない属性のため getattr で参照する)
+    return getattr(batch, "failed_operations", [])
+
+
+def chunked(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    """items を先頭から size 件ずつに分割する"""
+    for start in range(0, len(items), size):
+        stop = start + size
+        yield items[start:stop]
+
+
+def batch_get_ids(
+    owner_id: str,
+    *requests: Tuple[Type[Union[DogModel, TaskModel]], Attribute, Iterable[str]],
+) -> List[Set[str]]:
+    keys = [
+        (model_class.Meta.table_name, attribute_name(range_key), value)
+        for (model_class, range_key, values) in requests
+        for value in set(values)
+    ]
+    found: Dict[str, Set[str]] = {x.Meta.table_name: set() for (x, _, _) in requests}
+    names = {x.Meta.table_name: attribute_name(y) for (x, y, _) in requests}
+
+    for chunk in chunked(keys, BATCH_GET_MAX_ITEMS):
+        request_items: Dict[str, Any] = {}
+        for (table_name, name, value) in chunk:
+            request_items.setdefault(
+                table_name, {KEYS: [], PROJECTION_EXPRESSION: f"owner_id, {name}"}
+            )[KEYS].append({"owner_id": {"S": owner_id}, name: {"S": value}})
+
+        retries = 0
+        while True:
+            data = connection.dispatch(BATCH_GET_ITEM, {REQUEST_ITEMS: request_items})
+            for (table_name, items) in data.get(RESPONSES, {}).items():
+                found[table_name].update(x[names[table_name]]["S"] for x in items)
+            request_items = data.get(UNPROCESSED_KEYS)
+            if not request_items:
+                break
+            # 未処理のキーは PynamoDB の BatchWrite と同じく、回数の上限付きで指数バックオフして再送する
+            retries += 1
+            if retries >= ModelMeta.max_retry_attempts:
+                unfetched = sum(len(x[KEYS]) for x in request_items.values())
+                raise GetError(
+                    "Failed to batch get items: max_retry_attempts exceeded "
+                    f"({unfetched} keys are unprocessed)"
+                )
+            time.sleep(
+                random.randint(0, ModelMeta.base_backoff_ms * 2**retries) / 1000
+            )
+
+    return [found[x.Meta.table_name] for (x, _, _) in requests]
+
+
+def is_owner_exists(owner_id: str) -> bool:
     try:
-        OwnerModel.get(hash_key=owner_id)
+        OwnerModel.get(hash_key=owner_id, attributes_to_get=["id"])
     except OwnerModel.DoesNotExist:
+        return False
+    return True
+
+
+def is_condition_failed(e: PynamoDBException) -> bool:
+    if e.cause_response_code == "ConditionalCheckFailedException":
+        return True
+    reasons = getattr(e.cause, "response", {}).get("CancellationReasons")
+    if reasons is None:
+        return "ConditionalCheckFailed" in (e.cause_response_message or "")
+    return any(x.get("Code") == "ConditionalCheckFailed" for x in reasons)
+
+
+def save_unique(
+    model: Model,
+    unique: UniqueModel,
+    previous: Optional[UniqueModel] = None,
+    condition: Optional[Condition] = None,
+) -> None:
+    with transact_write() as transaction:
+        if previous is None or previous.id != unique.id:
+            if previous is not None:
+                transaction.delete(previous)
+            transaction.save(unique, condition=UniqueModel.id.does_not_exist())
+        transaction.save(model, condition=condition)
+
+
+def delete_unique(
+    model_class: Type[Ordered],
+    hash_key: str,
+    range_key: str,
+    unique: Callable[[Ordered], UniqueModel],
+) -> Optional[Ordered]:
+    """一意制約(犬名・タスク名)を持つアイテムと、その予約アイテムを1つのトランザクションで削除する
+
+    予約アイテムの特定に名前が必要なため先に読み出し、読み出した時点から更新されていない場合のみ削除する。
+    (削除までの間に名前が変更された場合は、読み直して再試行する)
+    """
+    for attempt in range(1, ModelMeta.max_retry_attempts + 1):
+        try:
+            model = model_class.get(hash_key, range_key, consistent_read=True)
+        except model_class.DoesNotExist:
+            return None
+        try:
+            with transact_write() as transaction:
+                transaction.delete(
+                    model, condition=version_condition(model_class, model.version)
+                )
+                transaction.delete(unique(model))
+        except TransactWriteError as e:
+            if not is_condition_failed(e) or attempt == ModelMeta.max_retry_attempts:
+                raise e
+            continue
+        return model
+    return None
+
+
+def delete_item(
+    model_class: Type[Versioned], hash_key: str, range_key: str
+) -> Optional[Versioned]:
+    data = connection.delete_item(
+        model_class.Meta.table_name,
+        hash_key,
+        range_key=range_key,
+        return_values=ALL_OLD,
+    )
+    attributes = data.get("Attributes")
+    if not attributes:
+        return None
+    return model_class.from_raw_data(attributes)
+
+
+def delete_events(owner_id: str, index: Index, range_key: Attribute, id: str) -> int:
+    # 犬ID・タスクIDごとのGSIから、キーが "<ID>#" で始まるイベント情報のみを読み出す
+    models = [
+        *index.query(
+            hash_key=owner_id,
+            range_key_condition=range_key.startswith(f"{id}#"),
+            attributes_to_get=[
+                "owner_id",
+                "event_id",
+                "timestamp",
+                "dog_id",
+                "task_id",
+            ],
+        )
+    ]
+    deleted: List[EventModel] = []
+    for chunk in chunked(models, BATCH_WRITE_MAX_ITEMS):
+        batch = EventModel.batch_write()
+        try:
+            with batch:
+                for model in chunk:
+                    batch.delete(model)
+        except PutError as e:
+            logger.warning(f"failed to batch delete events: {e}")
+            failed = {
+                x[DELETE_REQUEST][KEY]["event_id"]["S"]
+                for x in failed_operations(batch)
+            }
+            if failed:
+                deleted.extend(x for x in chunk if x.event_id not in failed)
+            continue
+        deleted.extend(chunk)
+    update_event_stats(owner_id, removed=deleted)
+    return len(deleted)
+
+
+def update_event_stats(
+    owner_id: str,
+    added: Iterable[EventModel] = (),
+    removed: Iterable[EventModel] = (),
+) -> None:
+    counts: Counter = Counter()
+    for (events, sign) in [(added, 1), (removed, -1)]:
+        for event in events:
+            day = EventStatModel.to_day(event.timestamp)
+            counts[(day, event.dog_id, event.task_id)] += sign
+
+    for ((day, dog_id, task_id), count) in counts.items():
+        if count == 0:
+            continue
+        bucket = EventStatModel.day_bucket(day, dog_id, task_id)
+        try:
+            EventStatModel(owner_id, bucket).update(
+                actions=[
+                    EventStatModel.total.add(count),
+                    EventStatModel.day.set(day),
+                    EventStatModel.dog_id.set(dog_id),
+                    EventStatModel.task_id.set(task_id),
+                ]
+            )
+        except UpdateError as e:
+            logger.warning(f"failed to update event stat [{owner_id}/{bucket}]: {e}")
+
+
+def batch_save(models: Sequence[Model], range_key: Attribute) -> Set[str]:
+    failed: Set[str] = set()
+    for chunk in chunked(models, BATCH_WRITE_MAX_ITEMS):
+        batch = type(chunk[0]).batch_write()
+        try:
+            with batch:
+                for model in chunk:
+                    batch.save(model)
+        except PutError as e:
+            logger.warning(f"failed to batch write items: {e}")
+            name = attribute_name(range_key)
+            if not failed_operations(batch):
+                failed.update(getattr(x, name) for x in chunk)
+            for item in failed_operations(batch):
+                failed.add(item[PUT_REQUEST][ITEM][name]["S"])
+    return failed
+
+
+def validate_order_ids(
+    model_class: Type[Ordered], range_key: Attribute, owner_id: str, ids: List[str]
+) -> None:
+    """表示順の一括更新で指定されたIDが、オーナーに紐付く全てのIDと過不足なく一致することを確認する"""
+    name = model_class.__name__.replace("Model", "").lower()
+    if len(set(ids)) != len(ids):
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="owner not found.",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids are duplicated.",
         )
-    return owner_id
+
+    key = attribute_name(range_key)
+    stored = {
+        getattr(x, key)
+        for x in model_class.query(hash_key=owner_id, attributes_to_get=[key])
+    }
+    if not stored.issuperset(ids):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"illegal {name} id.",
+        )
+    if len(ids) != len(stored):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"all {name} ids are required.",
+        )
+
+
+def write_orders(models: Sequence[Ordered], range_key: Attribute) -> None:
+    updated_at = int(datetime.timestamp(datetime.now()))
+    for chunk in chunked(models, TRANSACT_WRITE_MAX_ITEMS):
+        with transact_write() as transaction:
+            for model in chunk:
+                model_class = type(model)
+                transaction.update(
+                    model,
+                    actions=[
+                        model_class.order.set(model.order),
+                        model_class.updated_at.set(updated_at),
+                        model_class.version.add(1),
+                    ],
+                    condition=range_key.exists(),
+                )
+
+
+def compact_orders(
+    model_class: Type[Ordered], range_key: Attribute, owner_id: str
+) -> None:
+    models = sorted(
+        model_class.query(
+            hash_key=owner_id,
+            attributes_to_get=["owner_id", attribute_name(range_key), "order"],
+        ),
+        key=lambda x: x.order,
+    )
+
+    changes: List[Ordered] = []
+    for (idx, model) in enumerate(models):
+        if idx + 1 == model.order:
+            continue
+        model.order = idx + 1
+        changes.append(model)
+
+    try:
+        write_orders(changes, range_key)
+    except TransactWriteError as e:
+        logger.warning(f"failed to compact orders of owner [{owner_id}]: {e}")
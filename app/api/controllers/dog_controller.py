@@ -1,14 +1,58 @@
 import uuid
 from datetime import datetime
-from typing import List, Optional
-
-from app.api.controllers.common import owner_id_parameter
-from app.api.controllers.model import EmptyResponse, Message
+from typing import Any, Dict, List, Optional, Union
+
+from app.api.controllers.common import (
+    NEXT_CURSOR_RESPONSE,
+    NOT_MODIFIED_RESPONSE,
+    check_etag,
+    compact_orders,
+    cursor_parameter,
+    delete_events,
+    delete_unique,
+    fields_parameter,
+    fields_response,
+    is_condition_failed,
+    is_item_exists,
+    limit_parameter,
+    list_etag,
+    owner_id_parameter,
+    projection,
+    reference_cache,
+    resource_etag,
+    save_unique,
+    select_fields,
+    set_next_cursor,
+    update_item,
+    update_unique_item,
+    validate_order_ids,
+    version_condition,
+    write_orders,
+)
+from app.api.controllers.model import (
+    DeleteResponse,
+    EmptyResponse,
+    Message,
+    OrderRequest,
+)
 from app.custom_logging import CustomLogger
 from app.models.dog_model import DogModel
-from fastapi import APIRouter, Body, HTTPException, Path, status
+from app.models.event_model import EventModel
+from app.models.unique_model import UniqueModel
+from fastapi import (
+    APIRouter,
+    Body,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    status,
+)
 from fastapi.param_functions import Depends
 from pydantic import BaseModel, Field
+from pynamodb.exceptions import TransactWriteError
 
 router = APIRouter()
 logger = CustomLogger.getApplicationLogger()
@@ -38,6 +82,18 @@ class DogRequest(BaseModel):
         return model
 
 
+class DogPatchRequest(BaseModel):
+    name: Optional[str] = Field(None, title="名前")
+    order: Optional[int] = Field(None, title="画面表示順", ge=1)
+    birth: Optional[int] = Field(None, title="誕生日(unixtime)", ge=0)
+    gender: Optional[int] = Field(None, title="性別", ge=0)
+    color: Optional[int] = Field(None, title="毛の色", ge=0)
+    image_path: Optional[str] = Field(
+        None, regex="^[a-z0-9/.]+$", title="画像パス、事前にImageリソースで登録した際に発行されたパス"
+    )
+    enabled: Optional[bool] = Field(None, title="有効フラグ")
+
+
 class DogResponse(DogRequest):
     id: str = Field(..., title="犬ID")
     updated_at: int = Field(..., title="更新日時(unixtime)")
@@ -68,21 +124,43 @@ def dog_id_parameter(
     "/",
     response_model=List[DogResponse],
     response_model_exclude_unset=True,
-    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    responses={
+        status.HTTP_200_OK: NEXT_CURSOR_RESPONSE,
+        status.HTTP_304_NOT_MODIFIED: NOT_MODIFIED_RESPONSE,
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
     summary="犬情報の一覧取得",
-    description="オーナーに紐付く犬情報の一覧を取得します",
+    description=(
+        "オーナーに紐付く犬情報の一覧を、画面表示順に並べて取得します。"
+        "limitを指定した場合はID順にページングされ、画面表示順での並べ替えはページ内でのみ行われます。"
+        "続きがある場合はレスポンスヘッダ X-Next-Cursor の値を cursor に指定して次ページを取得します"
+    ),
 )
 def list(
+    request: Request,
+    response: Response,
     owner_id: str = Depends(owner_id_parameter),
-) -> List[DogResponse]:
-    dogs = [x for x in DogModel.query(hash_key=owner_id)]
-    dogs.sort(key=lambda x: x.order)
-    for (idx, dog) in enumerate(dogs):
-        if idx + 1 == dog.order:
-            continue
-        dog.order = idx + 1
-        dog.save()
-
+    limit: Optional[int] = Depends(limit_parameter),
+    cursor: Optional[Dict[str, Any]] = Depends(cursor_parameter),
+    fields: Optional[List[str]] = Depends(fields_parameter(DogResponse)),
+) -> Union[List[DogResponse], Response]:
+    models = DogModel.query(
+        hash_key=owner_id,
+        limit=limit,
+        last_evaluated_key=cursor,
+        attributes_to_get=projection(fields, "dog_id", "order", "version"),
+    )
+    dogs = sorted(models, key=lambda x: x.order)
+    set_next_cursor(response, models.last_evaluated_key)
+    etag = list_etag(request, [(x.dog_id, x.version, x.order) for x in dogs])
+    not_modified = check_etag(request, response, etag)
+    if not_modified is not None:
+        return not_modified
+    if fields is not None:
+        return fields_response(
+            response, [select_fields(x, fields, "dog_id") for x in dogs]
+        )
     return [DogResponse.from_model(x) for x in dogs]
 
 
@@ -90,22 +168,41 @@ def list(
     "/{id}",
     response_model=DogResponse,
     response_model_exclude_unset=True,
-    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    responses={
+        status.HTTP_304_NOT_MODIFIED: NOT_MODIFIED_RESPONSE,
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
     summary="犬情報の1件取得",
     description="オーナーに紐付く犬情報を1件取得します",
 )
 def get(
-    owner_id: str = Depends(owner_id_parameter), dog_id: str = Depends(dog_id_parameter)
-) -> DogResponse:
+    request: Request,
+    response: Response,
+    owner_id: str = Depends(owner_id_parameter),
+    dog_id: str = Depends(dog_id_parameter),
+    fields: Optional[List[str]] = Depends(fields_parameter(DogResponse)),
+) -> Union[DogResponse, Response]:
 
     try:
-        return DogResponse.from_model(DogModel.get(hash_key=owner_id, range_key=dog_id))
+        model = DogModel.get(
+            hash_key=owner_id,
+            range_key=dog_id,
+            attributes_to_get=projection(fields, "dog_id", "version"),
+        )
     except DogModel.DoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="dog not found.",
         )
 
+    not_modified = check_etag(request, response, resource_etag(model.version))
+    if not_modified is not None:
+        return not_modified
+    if fields is not None:
+        return fields_response(response, select_fields(model, fields, "dog_id"))
+    return DogResponse.from_model(model)
+
 
 @router.post(
     "/",
@@ -124,22 +221,62 @@ def post(
     request: DogRequest = Body(...),
 ) -> DogResponse:
 
-    if is_name_exists(owner_id, request.name):
+    model = request.to_model(owner_id)
+    try:
+        save_unique(model, UniqueModel.dog_name(owner_id, model.name))
+    except TransactWriteError as e:
+        if not is_condition_failed(e):
+            raise e
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="name is already exists.",
         )
-
-    model = request.to_model(owner_id)
-    model.save()
+    reference_cache.invalidate(("dog", owner_id))
     return DogResponse.from_model(model)
 
 
+@router.put(
+    "/order",
+    response_model=EmptyResponse,
+    response_model_exclude_unset=True,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
+    summary="犬情報の表示順の一括更新",
+    description="オーナーに紐付く全ての犬情報のIDを画面表示順に並べて指定し、表示順を一括更新します",
+)
+def put_order(
+    owner_id: str = Depends(owner_id_parameter),
+    request: OrderRequest = Body(...),
+) -> EmptyResponse:
+    validate_order_ids(DogModel, DogModel.dog_id, owner_id, request.ids)
+
+    models = [
+        DogModel(owner_id, dog_id, order=idx + 1)
+        for (idx, dog_id) in enumerate(request.ids)
+    ]
+    try:
+        write_orders(models, DogModel.dog_id)
+    except TransactWriteError as e:
+        if not is_condition_failed(e):
+            raise e
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="illegal dog id.",
+        )
+    return EmptyResponse()
+
+
 @router.put(
     "/{id}",
     response_model=DogResponse,
     response_model_exclude_unset=True,
-    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+        status.HTTP_412_PRECONDITION_FAILED: {"model": Message},
+    },
     summary="犬情報の更新",
     description="オーナーに紐付く犬情報を更新します",
 )
@@ -157,35 +294,101 @@ def put(
             detail="dog is not exist.",
         )
 
+    previous = UniqueModel.dog_name(owner_id, model.name)
     for (key, value) in request.dict().items():
         setattr(model, key, value)
     model.updated_at = int(datetime.timestamp(datetime.now()))
-    model.save()
+    version = model.version
+    model.version = version + 1
+    unique = UniqueModel.dog_name(owner_id, model.name)
+    try:
+        save_unique(model, unique, previous, version_condition(DogModel, version))
+    except TransactWriteError as e:
+        if not is_condition_failed(e):
+            raise e
+        if unique.id != previous.id and is_item_exists(UniqueModel, unique.id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="name is already exists.",
+            )
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="precondition failed.",
+        )
+    return DogResponse.from_model(model)
+
+
+@router.patch(
+    "/{id}",
+    response_model=DogResponse,
+    response_model_exclude_unset=True,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+        status.HTTP_412_PRECONDITION_FAILED: {"model": Message},
+    },
+    summary="犬情報の部分更新",
+    description=(
+        "オーナーに紐付く犬情報のうち、指定された項目のみを更新します。"
+        "If-Match に取得時のETagを指定した場合、その後に更新されていないときのみ更新します"
+    ),
+)
+def patch(
+    response: Response,
+    owner_id: str = Depends(owner_id_parameter),
+    dog_id: str = Depends(dog_id_parameter),
+    if_match: Optional[str] = Header(None, description="取得時のETag"),
+    request: DogPatchRequest = Body(...),
+) -> DogResponse:
+    changes = request.dict(exclude_unset=True)
+    if "name" not in changes:
+        model = DogModel(owner_id, dog_id)
+        update_item(model, DogModel.dog_id, changes, if_match, "dog not found.")
+    else:
+        try:
+            model = DogModel.get(hash_key=owner_id, range_key=dog_id)
+        except DogModel.DoesNotExist:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="dog not found.",
+            )
+        update_unique_item(
+            model,
+            DogModel.dog_id,
+            changes,
+            if_match,
+            UniqueModel.dog_name(owner_id, changes["name"]),
+            UniqueModel.dog_name(owner_id, model.name),
+            "name is already exists.",
+        )
+
+    response.headers["ETag"] = resource_etag(model.version)
     return DogResponse.from_model(model)
 
 
 @router.delete(
     "/{id}",
-    response_model=EmptyResponse,
+    response_model=DeleteResponse,
     response_model_exclude_unset=True,
     responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
     summary="犬情報の削除",
-    description="オーナーに紐付く犬情報を削除します",
+    description="オーナーに紐付く犬情報を削除します。cascadeを指定した場合、犬情報に紐付くイベント情報も削除し、その件数を返却します",
 )
 def delete(
     owner_id: str = Depends(owner_id_parameter),
     dog_id: str = Depends(dog_id_parameter),
-) -> EmptyResponse:
-
-    for model in DogModel.query(
-        hash_key=owner_id, range_key_condition=DogModel.dog_id == dog_id
-    ):
-        model.delete()
-    return EmptyResponse()
-
+    cascade: bool = Query(False, description="紐付くイベント情報も削除する"),
+) -> DeleteResponse:
+    model = delete_unique(
+        DogModel, owner_id, dog_id, lambda x: UniqueModel.dog_name(owner_id, x.name)
+    )
+    if model is not None:
+        reference_cache.invalidate(("dog", owner_id))
+        compact_orders(DogModel, DogModel.dog_id, owner_id)
 
-def is_name_exists(owner_id: str, name: str) -> bool:
-    for model in DogModel.query(hash_key=owner_id, limit=1):
-        if model.name == name:
-            return True
-    return False
+    if cascade:
+        count = delete_events(
+            owner_id, EventModel.dog_timestamp_index, EventModel.dog_timestamp, dog_id
+        )
+        return DeleteResponse(deleted_events=count)
+    return DeleteResponse()
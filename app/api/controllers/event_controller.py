@@ -1,22 +1,70 @@
+import asyncio
+import os
 import uuid
+from collections import Counter
 from datetime import datetime
-from typing import List
+from tempfile import SpooledTemporaryFile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
 
-from fastapi import APIRouter, Body, HTTPException, Path, Query, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    status,
+)
 from fastapi.param_functions import Depends
+from fastapi.responses import RedirectResponse, StreamingResponse
 from pydantic import BaseModel
 from pydantic.fields import Field
+from pynamodb.exceptions import PutError, UpdateError
+from pynamodb.pagination import ResultIterator
 
-from app.api.controllers.common import owner_id_parameter
+from app.api.controllers.common import (
+    NEXT_CURSOR_RESPONSE,
+    NOT_MODIFIED_RESPONSE,
+    batch_save,
+    check_etag,
+    check_owner_async,
+    cursor_parameter,
+    delete_item,
+    is_condition_failed,
+    limit_parameter,
+    list_etag,
+    owner_id_parameter,
+    owner_id_path,
+    resource_etag,
+    set_next_cursor,
+    update_event_stats,
+    update_item,
+    valid_references,
+    version_condition,
+)
 from app.api.controllers.model import EmptyResponse, Message
+from app.client_config import s3_client
 from app.custom_logging import CustomLogger
+from app.export import CSV_GZ, MEDIA_TYPES, EventColumns, supported_formats
+from app.models import repository
 from app.models.dog_model import DogModel
 from app.models.event_model import EventModel
-from app.models.task_model import TaskModel
+from app.models.event_stat_model import EventStatModel
 
 router = APIRouter()
 logger = CustomLogger.getApplicationLogger()
 
+EVENT_BATCH_MAX_ITEMS = 500
+NDJSON = "application/x-ndjson"
+
+EXPORT_BUCKET = os.environ.get("EXPORT_BUCKET")
+EXPORT_INLINE_MAX_BYTES = int(
+    os.environ.get("EXPORT_INLINE_MAX_BYTES", 4 * 1024 * 1024)
+)
+EXPORT_URL_EXPIRES_IN = 3600
+
 
 class EventRequest(BaseModel):
     timestamp: int = Field(..., title="実施日時(unixtime)")
@@ -32,10 +80,23 @@ class EventRequest(BaseModel):
             if key not in model.get_attributes().keys() or not value:
                 continue
             setattr(model, key, value)
+        model.update_index_keys()
 
         return model
 
 
+class EventBatchRequest(BaseModel):
+    events: List[EventRequest] = Field(
+        ..., title="登録するイベント情報の一覧", min_items=1, max_items=EVENT_BATCH_MAX_ITEMS
+    )
+
+
+class EventPatchRequest(BaseModel):
+    timestamp: Optional[int] = Field(None, title="実施日時(unixtime)")
+    task_id: Optional[str] = Field(None, title="タスクID")
+    dog_id: Optional[str] = Field(None, title="犬D")
+
+
 class EventResponse(EventRequest):
     id: str = Field(..., title="イベントID")
     updated_at: int = Field(..., title="更新日時(unixtime)")
@@ -52,6 +113,21 @@ class EventResponse(EventRequest):
         return response
 
 
+class EventStatResponse(BaseModel):
+    bucket: str = Field(
+        ..., title="集計期間(day: YYYY-MM-DD、week: YYYY-Www、month: YYYY-MM)"
+    )
+    dog_id: str = Field(..., title="犬ID")
+    task_id: str = Field(..., title="タスクID")
+    count: int = Field(..., title="イベント件数")
+
+
+class EventBatchResult(BaseModel):
+    status: int = Field(..., title="登録結果のステータスコード")
+    event: Optional[EventResponse] = Field(None, title="登録したイベント情報、登録できた場合のみ返却")
+    detail: Optional[str] = Field(None, title="登録できなかった理由")
+
+
 def event_id_parameter(
     event_id: str = Path(..., regex="^[a-z0-9]{32}$", description="イベントID", alias="id"),
 ):
@@ -62,54 +138,286 @@ def event_id_parameter(
     "/",
     response_model=List[EventResponse],
     response_model_exclude_unset=True,
-    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    responses={
+        status.HTTP_200_OK: {
+            **NEXT_CURSOR_RESPONSE,
+            "content": {
+                NDJSON: {"schema": {"$ref": "#/components/schemas/EventResponse"}}
+            },
+        },
+        status.HTTP_304_NOT_MODIFIED: NOT_MODIFIED_RESPONSE,
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
     summary="イベント情報の一覧取得",
-    description="オーナーに紐付くイベント情報の一覧を取得します",
+    description=(
+        "オーナーに紐付くイベント情報の一覧を、犬の画面表示順、実施日時の昇順に並べて取得します。"
+        "limitまたはcursorを指定した場合は実施日時の昇順でページングされ、犬の画面表示順での並べ替えは行いません。"
+        "続きがある場合はレスポンスヘッダ X-Next-Cursor の値を cursor に指定して次ページを取得します。"
+        "Accept に application/x-ndjson を指定した場合は、実施日時の昇順に1行1件のJSONで逐次返却します"
+        "(X-Next-Cursor、ETagは返却されません)"
+    ),
+)
+async def list(
+    request: Request,
+    response: Response,
+    owner_id: str = Depends(owner_id_path),
+    from_timestamp: int = Query(..., description="実施日時:開始(unixtime)", alias="from"),
+    to_timestamp: int = Query(..., description="実施日時:終了(unixtime)", alias="to"),
+    dog_id: Optional[str] = Query(None, regex="^[a-z0-9]{32}$", description="犬ID"),
+    task_id: Optional[str] = Query(None, regex="^[a-z0-9]{32}$", description="タスクID"),
+    limit: Optional[int] = Depends(limit_parameter),
+    cursor: Optional[Dict[str, Any]] = Depends(cursor_parameter),
+) -> Union[List[EventResponse], Response]:
+    def query() -> ResultIterator:
+        return query_events(
+            owner_id, from_timestamp, to_timestamp, dog_id, task_id, limit, cursor
+        )
+
+    if NDJSON in request.headers.get("accept", ""):
+        await check_owner_async(owner_id)
+        return StreamingResponse(stream_events(query()), media_type=NDJSON)
+
+    # オーナーの存在確認、イベント情報・犬情報の取得は互いに独立しているため並行して行う
+    if limit is not None or cursor is not None:
+        (_, (events, last_evaluated_key)) = await asyncio.gather(
+            check_owner_async(owner_id), repository.fetch(query)
+        )
+        set_next_cursor(response, last_evaluated_key)
+        etag = list_etag(request, [(x.event_id, x.version) for x in events])
+        not_modified = check_etag(request, response, etag)
+        if not_modified is not None:
+            return not_modified
+        return [EventResponse.from_model(x) for x in events]
+
+    (_, (events, _), dogs) = await asyncio.gather(
+        check_owner_async(owner_id),
+        repository.fetch(query),
+        repository.query(DogModel, owner_id),
+    )
+    dogs.sort(key=lambda x: x.order)
+    etag = list_etag(
+        request,
+        [
+            *[(x.dog_id, x.version, x.order) for x in dogs],
+            *[(x.event_id, x.version) for x in events],
+        ],
+    )
+    not_modified = check_etag(request, response, etag)
+    if not_modified is not None:
+        return not_modified
+
+    return [EventResponse.from_model(x) for x in group_by_dog(dogs, events)]
+
+
+@router.get(
+    "/stats",
+    response_model=List[EventStatResponse],
+    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    summary="イベント件数の集計取得",
+    description=(
+        "オーナーに紐付くイベント情報の件数を、集計期間・犬・タスクごとに取得します。"
+        "日単位の集計アイテムのみを読み出し、週・月単位はその合算で求めます(日付はJST)。"
+        "週・月の途中で期間を区切った場合、期間内の日のみが集計されます"
+    ),
 )
-def list(
+def stats(
     owner_id: str = Depends(owner_id_parameter),
     from_timestamp: int = Query(..., description="実施日時:開始(unixtime)", alias="from"),
     to_timestamp: int = Query(..., description="実施日時:終了(unixtime)", alias="to"),
-) -> List[EventResponse]:
-    events = [
-        *EventModel.timestamp_index.query(
+    granularity: str = Query(
+        "day", regex="^(day|week|month)$", description="集計単位(day、week、month)"
+    ),
+) -> List[EventStatResponse]:
+    from_bucket = f"day#{EventStatModel.to_day(from_timestamp)}"
+    # 終了日の全アイテムを含めるため、区切り文字 "#" より大きい "$" を付ける
+    to_bucket = f"day#{EventStatModel.to_day(to_timestamp)}$"
+
+    counts: Counter = Counter()
+    for model in EventStatModel.query(
+        hash_key=owner_id,
+        range_key_condition=EventStatModel.bucket.between(from_bucket, to_bucket),
+    ):
+        bucket = bucket_label(model.day, granularity)
+        counts[(bucket, model.dog_id, model.task_id)] += model.total
+
+    return [
+        EventStatResponse(bucket=bucket, dog_id=dog_id, task_id=task_id, count=count)
+        for ((bucket, dog_id, task_id), count) in sorted(counts.items())
+        if count > 0
+    ]
+
+
+def bucket_label(day: int, granularity: str) -> str:
+    date = datetime.strptime(str(day), "%Y%m%d")
+    if granularity == "week":
+        (year, week, _) = date.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == "month":
+        return date.strftime("%Y-%m")
+    return date.strftime("%Y-%m-%d")
+
+
+@router.get(
+    "/export",
+    response_class=Response,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "エクスポートファイル",
+            "content": {x: {} for x in MEDIA_TYPES.values()},
+        },
+        status.HTTP_303_SEE_OTHER: {"description": "ファイルが大きい場合、S3の署名付きURLへリダイレクト"},
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
+    summary="イベント情報のエクスポート",
+    description=(
+        "オーナーに紐付くイベント情報を、実施日時の昇順で圧縮ファイルとして取得します。"
+        "csv.gz はgzip圧縮したCSV、arrow は犬ID・タスクIDを辞書エンコードしたApache Arrow(IPCファイル、zstd圧縮)です。"
+        "ファイルが大きい場合はS3へ配置し、その署名付きURLへリダイレクトします"
+    ),
+)
+def export(
+    owner_id: str = Depends(owner_id_parameter),
+    format: str = Query(
+        CSV_GZ, regex=r"^(csv\.gz|arrow)$", description="ファイル形式(csv.gz、arrow)"
+    ),
+    from_timestamp: int = Query(0, description="実施日時:開始(unixtime)", alias="from"),
+    to_timestamp: int = Query(9999999999, description="実施日時:終了(unixtime)", alias="to"),
+):
+    if format not in supported_formats():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format [{format}] is not supported.",
+        )
+
+    columns = EventColumns.from_models(
+        query_events(owner_id, from_timestamp, to_timestamp, None, None, None, None)
+    )
+    filename = f"events-{owner_id}.{format}"
+    disposition = f'attachment; filename="{filename}"'
+    with SpooledTemporaryFile(max_size=EXPORT_INLINE_MAX_BYTES) as fileobj:
+        columns.write(format, fileobj)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        if size <= EXPORT_INLINE_MAX_BYTES:
+            return Response(
+                content=fileobj.read(),
+                media_type=MEDIA_TYPES[format],
+                headers={"Content-Disposition": disposition},
+            )
+
+        if EXPORT_BUCKET is None:
+            logger.error("EXPORT_BUCKET is not set, large exports cannot be returned.")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="export bucket is not configured.",
+            )
+        key = f"exports/{owner_id}/{str(uuid.uuid4()).replace('-', '')}.{format}"
+        s3_client().upload_fileobj(
+            fileobj, EXPORT_BUCKET, key, ExtraArgs={"ContentType": MEDIA_TYPES[format]}
+        )
+    url = s3_client().generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": EXPORT_BUCKET,
+            "Key": key,
+            "ResponseContentDisposition": disposition,
+        },
+        ExpiresIn=EXPORT_URL_EXPIRES_IN,
+    )
+    return RedirectResponse(url, status_code=status.HTTP_303_SEE_OTHER)
+
+
+def query_events(
+    owner_id: str,
+    from_timestamp: int,
+    to_timestamp: int,
+    dog_id: Optional[str],
+    task_id: Optional[str],
+    limit: Optional[int],
+    cursor: Optional[Dict[str, Any]],
+) -> ResultIterator:
+    # 犬IDまたはタスクIDの指定がある場合、その実施日時順のGSIから該当分のみを読み出す
+    if dog_id is not None:
+        return EventModel.dog_timestamp_index.query(
             hash_key=owner_id,
-            range_key_condition=EventModel.timestamp.between(
-                from_timestamp, to_timestamp
+            range_key_condition=EventModel.dog_timestamp.between(
+                EventModel.index_key(dog_id, from_timestamp),
+                EventModel.index_key(dog_id, to_timestamp),
+            ),
+            filter_condition=(
+                EventModel.task_id == task_id if task_id is not None else None
             ),
+            limit=limit,
+            last_evaluated_key=cursor,
         )
-    ]
-    dogs = sorted(DogModel.query(hash_key=owner_id), key=lambda x: x.order)
-    results: List[EventModel] = []
-    for dog in dogs:
-        items = filter(lambda x: x.dog_id == dog.dog_id, events)
-        results.extend(sorted(items, key=lambda x: x.timestamp))
-    return [EventResponse.from_model(x) for x in results]
+    if task_id is not None:
+        return EventModel.task_timestamp_index.query(
+            hash_key=owner_id,
+            range_key_condition=EventModel.task_timestamp.between(
+                EventModel.index_key(task_id, from_timestamp),
+                EventModel.index_key(task_id, to_timestamp),
+            ),
+            limit=limit,
+            last_evaluated_key=cursor,
+        )
+    return EventModel.timestamp_index.query(
+        hash_key=owner_id,
+        range_key_condition=EventModel.timestamp.between(from_timestamp, to_timestamp),
+        limit=limit,
+        last_evaluated_key=cursor,
+    )
+
+
+def stream_events(models: Iterable[EventModel]) -> Iterator[str]:
+    # クエリ結果はページ単位で遅延取得されるため、全件をメモリに保持しない
+    # Mangum(Lambda)上ではレスポンス全体がバッファリングされてから返却される
+    for model in models:
+        yield EventResponse.from_model(model).json() + "\n"
+
+
+def group_by_dog(dogs: List[DogModel], events: List[EventModel]) -> List[EventModel]:
+    # timestamp_index の結果は実施日時の昇順のため、犬ごとに振り分けるだけで並びが保たれる
+    grouped: Dict[str, List[EventModel]] = {x.dog_id: [] for x in dogs}
+    for event in events:
+        if event.dog_id in grouped:
+            grouped[event.dog_id].append(event)
+    return [x for dog in dogs for x in grouped[dog.dog_id]]
 
 
 @router.get(
     "/{id}",
     response_model=EventResponse,
     response_model_exclude_unset=True,
-    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    responses={
+        status.HTTP_304_NOT_MODIFIED: NOT_MODIFIED_RESPONSE,
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
     summary="イベント情報の1件取得",
     description="オーナーに紐付くイベント情報を1件取得します",
 )
-def get(
-    owner_id: str = Depends(owner_id_parameter),
+async def get(
+    request: Request,
+    response: Response,
+    owner_id: str = Depends(owner_id_path),
     event_id: str = Depends(event_id_parameter),
-) -> EventResponse:
+) -> Union[EventResponse, Response]:
 
-    try:
-        return EventResponse.from_model(
-            EventModel.get(hash_key=owner_id, range_key=event_id)
-        )
-    except EventModel.DoesNotExist:
+    (_, model) = await asyncio.gather(
+        check_owner_async(owner_id), repository.get(EventModel, owner_id, event_id)
+    )
+    if model is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="event not found.",
         )
 
+    not_modified = check_etag(request, response, resource_etag(model.version))
+    if not_modified is not None:
+        return not_modified
+    return EventResponse.from_model(model)
+
 
 @router.post(
     "/",
@@ -127,17 +435,85 @@ def post(
     owner_id: str = Depends(owner_id_parameter),
     request: EventRequest = Body(...),
 ) -> EventResponse:
-    validate(owner_id, request)
+    validate(owner_id, request.dog_id, request.task_id)
     model = request.to_model(owner_id)
     model.save()
+    update_event_stats(owner_id, added=[model])
     return EventResponse.from_model(model)
 
 
+@router.post(
+    "/batch",
+    response_model=List[EventBatchResult],
+    response_model_exclude_unset=True,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
+    summary="イベント情報の一括登録",
+    description=(
+        f"オーナーに紐付くイベント情報を最大{EVENT_BATCH_MAX_ITEMS}件まとめて登録します。"
+        "登録結果はリクエストと同じ順序で1件ずつ返却され、不正な犬ID・タスクIDを含むものは登録されません"
+    ),
+)
+def post_batch(
+    owner_id: str = Depends(owner_id_parameter),
+    request: EventBatchRequest = Body(...),
+) -> List[EventBatchResult]:
+    (dog_ids, task_ids) = valid_references(
+        owner_id,
+        {x.dog_id for x in request.events},
+        {x.task_id for x in request.events},
+    )
+
+    invalids: Dict[int, str] = {}
+    models: Dict[int, EventModel] = {}
+    for (idx, event) in enumerate(request.events):
+        if event.dog_id not in dog_ids:
+            invalids[idx] = "illegal dog id."
+        elif event.task_id not in task_ids:
+            invalids[idx] = "illegal task id."
+        else:
+            models[idx] = event.to_model(owner_id)
+
+    failed = batch_save([*models.values()], EventModel.event_id)
+    update_event_stats(
+        owner_id, added=[x for x in models.values() if x.event_id not in failed]
+    )
+
+    results: List[EventBatchResult] = []
+    for idx in range(len(request.events)):
+        model = models.get(idx)
+        if model is None:
+            results.append(
+                EventBatchResult(
+                    status=status.HTTP_400_BAD_REQUEST, detail=invalids[idx]
+                )
+            )
+        elif model.event_id in failed:
+            results.append(
+                EventBatchResult(
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="failed to write event.",
+                )
+            )
+        else:
+            results.append(
+                EventBatchResult(
+                    status=status.HTTP_201_CREATED,
+                    event=EventResponse.from_model(model),
+                )
+            )
+    return results
+
+
 @router.put(
     "/{id}",
     response_model=EventResponse,
     response_model_exclude_unset=True,
-    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    responses={
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+        status.HTTP_412_PRECONDITION_FAILED: {"model": Message},
+    },
     summary="イベント情報の更新",
     description="オーナーに紐付くイベント情報を更新します",
 )
@@ -154,11 +530,62 @@ def put(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="event is not exist.",
         )
-    validate(owner_id, request)
+    validate(owner_id, request.dog_id, request.task_id)
+    previous = EventModel(**model.attribute_values)
     for (key, value) in request.dict().items():
         setattr(model, key, value)
+    model.update_index_keys()
     model.updated_at = int(datetime.timestamp(datetime.now()))
-    model.save()
+    model.version = previous.version + 1
+    try:
+        model.save(condition=version_condition(EventModel, previous.version))
+    except PutError as e:
+        if not is_condition_failed(e):
+            raise e
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="precondition failed.",
+        )
+    update_event_stats(owner_id, added=[model], removed=[previous])
+    return EventResponse.from_model(model)
+
+
+@router.patch(
+    "/{id}",
+    response_model=EventResponse,
+    response_model_exclude_unset=True,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+        status.HTTP_412_PRECONDITION_FAILED: {"model": Message},
+    },
+    summary="イベント情報の部分更新",
+    description=(
+        "オーナーに紐付くイベント情報のうち、指定された項目のみを更新します。"
+        "If-Match に取得時のETagを指定した場合、その後に更新されていないときのみ更新します"
+    ),
+)
+def patch(
+    response: Response,
+    owner_id: str = Depends(owner_id_parameter),
+    event_id: str = Depends(event_id_parameter),
+    if_match: Optional[str] = Header(None, description="取得時のETag"),
+    request: EventPatchRequest = Body(...),
+) -> EventResponse:
+    changes = request.dict(exclude_unset=True)
+    validate(owner_id, changes.get("dog_id"), changes.get("task_id"))
+
+    model = EventModel(owner_id, event_id)
+    previous = update_item(
+        model,
+        EventModel.event_id,
+        {**changes, **index_key_changes(changes)},
+        if_match,
+        "event not found.",
+    )
+    update_index_keys(model)
+    update_event_stats(owner_id, added=[model], removed=[previous])
+    response.headers["ETag"] = resource_etag(model.version)
     return EventResponse.from_model(model)
 
 
@@ -175,25 +602,58 @@ def delete(
     event_id: str = Depends(event_id_parameter),
 ) -> EmptyResponse:
 
-    for model in EventModel.query(
-        hash_key=owner_id, range_key_condition=EventModel.event_id == event_id
-    ):
-        model.delete()
+    model = delete_item(EventModel, owner_id, event_id)
+    if model is not None:
+        update_event_stats(owner_id, removed=[model])
     return EmptyResponse()
 
 
-def validate(owner_id: str, request: EventRequest) -> None:
+def index_key_changes(changes: Dict[str, Any]) -> Dict[str, str]:
+    """変更内容のみで決まる索引キー(犬ID・タスクIDと実施日時が共に変更される場合)
+
+    部分更新と同じ UpdateItem で書き込み、索引キーのための2回目の更新を不要にする。
+    """
+    keys: Dict[str, str] = {}
+    timestamp = changes.get("timestamp")
+    if timestamp is None:
+        return keys
+    if changes.get("dog_id") is not None:
+        keys["dog_timestamp"] = EventModel.index_key(changes["dog_id"], timestamp)
+    if changes.get("task_id") is not None:
+        keys["task_timestamp"] = EventModel.index_key(changes["task_id"], timestamp)
+    return keys
+
+
+def update_index_keys(model: EventModel) -> None:
+    # 変更内容のみで決まらない索引キーは、変更されなかった項目の値が更新後にしか分からないため別途更新する
+    keys = (model.dog_timestamp, model.task_timestamp)
+    model.update_index_keys()
+    if keys == (model.dog_timestamp, model.task_timestamp):
+        return
     try:
-        DogModel.get(hash_key=owner_id, range_key=request.dog_id)
-    except DogModel.DoesNotExist:
+        model.update(
+            actions=[
+                EventModel.dog_timestamp.set(model.dog_timestamp),
+                EventModel.task_timestamp.set(model.task_timestamp),
+            ],
+            condition=version_condition(EventModel, model.version),
+        )
+    except UpdateError as e:
+        # 後続の更新が索引キーも書き換えているため、何もしない
+        if not is_condition_failed(e):
+            raise e
+
+
+def validate(owner_id: str, dog_id: Optional[str], task_id: Optional[str]) -> None:
+    dog_ids = {dog_id} if dog_id is not None else set()
+    task_ids = {task_id} if task_id is not None else set()
+    (valid_dog_ids, valid_task_ids) = valid_references(owner_id, dog_ids, task_ids)
+    if dog_ids != valid_dog_ids:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="illegal dog id.",
         )
-
-    try:
-        TaskModel.get(hash_key=owner_id, range_key=request.task_id)
-    except TaskModel.DoesNotExist:
+    if task_ids != valid_task_ids:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="illegal event id.",
@@ -1,21 +1,67 @@
+import asyncio
 import os
+import re
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
 
-import boto3
-from app.api.controllers.common import owner_id_parameter
+from app import image
+from app.api.controllers.common import (
+    check_owner_async,
+    owner_id_parameter,
+    owner_id_path,
+)
 from app.api.controllers.model import EmptyResponse, Message
+from app.cache import TTLCache
+from app.client_config import s3_client
 from app.custom_logging import CustomLogger
+from app.models import repository
 from botocore.exceptions import ClientError
-from fastapi import APIRouter, File, HTTPException, Query, Response, UploadFile, status
+from fastapi import (
+    APIRouter,
+    Body,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
 from fastapi.param_functions import Depends
+from fastapi.responses import JSONResponse, RedirectResponse
 from pydantic import BaseModel, Field
 
 IMAGE_BUCKET = os.environ.get("IMAGE_BUCKET")
+IMAGE_URL_EXPIRES_IN = int(os.environ.get("IMAGE_URL_EXPIRES_IN", 900))
+# 期限切れ間際のURLを返却しないよう、期限のこの秒数前にキャッシュから破棄する
+IMAGE_URL_CACHE_MARGIN = int(os.environ.get("IMAGE_URL_CACHE_MARGIN", 60))
+
+IMAGE_CACHE_CONTROL = os.environ.get(
+    "IMAGE_CACHE_CONTROL", "private, max-age=31536000, immutable"
+)
+# S3 が扱えるのは単一の範囲指定のみのため、それ以外の Range は無視して全体を返却する
+RANGE_PATTERN = re.compile(r"^bytes=(\d+-\d*|-\d+)$")
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", 20 * 1024 * 1024))
+IMAGE_UPLOAD_EXPIRES_IN = int(os.environ.get("IMAGE_UPLOAD_EXPIRES_IN", 600))
+
+# 画像形式ごとのファイル先頭のバイト列(マジックバイト)
+IMAGE_SIGNATURES = {
+    "image/png": [b"\x89PNG\r\n\x1a\n"],
+    "image/gif": [b"GIF87a", b"GIF89a"],
+    "image/jpeg": [b"\xff\xd8\xff"],
+}
+IMAGE_SIGNATURE_BYTES = max(len(x) for v in IMAGE_SIGNATURES.values() for x in v)
 
 router = APIRouter()
 logger = CustomLogger.getApplicationLogger()
-s3 = boto3.resource("s3")
+
+image_url_cache = TTLCache(
+    maxsize=int(os.environ.get("IMAGE_URL_CACHE_SIZE", 1024)),
+    ttl=IMAGE_URL_EXPIRES_IN - IMAGE_URL_CACHE_MARGIN,
+)
 
 
 class ImageResponse(BaseModel):
@@ -26,6 +72,30 @@ class ImageDataResponse(BaseModel):
     data: bytes = Field(..., title="画像データ")
 
 
+class ImageUploadRequest(BaseModel):
+    content_type: str = Field(
+        ..., title="画像ファイルのcontent-type", regex="^image/(png|gif|jpeg)$"
+    )
+
+
+class ImageUploadResponse(BaseModel):
+    image_path: str = Field(..., title="画像パス")
+    url: str = Field(..., title="アップロード先のURL")
+    form_fields: Dict[str, str] = Field(
+        ..., title="アップロード時に multipart/form-data へ含めるフィールド"
+    )
+    expires_at: int = Field(..., title="アップロードの有効期限(unixtime)")
+
+
+class ImageFinalizeRequest(BaseModel):
+    image_path: str = Field(..., title="画像パス", regex="^[a-z0-9/.]+$")
+
+
+class ImageUrlResponse(BaseModel):
+    url: str = Field(..., title="画像データの取得URL")
+    expires_at: int = Field(..., title="URLの有効期限(unixtime)")
+
+
 def image_path_parameter(
     image_path: str = Query(..., regex="^[a-z0-9/.]+$", description="画像パス"),
 ):
@@ -50,54 +120,265 @@ async def post(
 ):
 
     content_type = file.content_type
-    if content_type not in ["image/png", "image/gif", "image/jpeg"]:
+    if content_type not in IMAGE_SIGNATURES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"content-type [{content_type}] is not supported.",
         )
 
     contents = await file.read()
-    now = datetime.now()
-    id = f"{str(uuid.uuid4()).replace('-', '')}.{content_type.split('/')[-1]}"
-    image_path = f'{now.strftime("%Y")}{now.strftime("%m")}{now.strftime("%d")}/{now.strftime("%H")}/{id}'
+    image_path = new_image_path(content_type)
 
-    obj = s3.Object(IMAGE_BUCKET, f"{owner_id}/{image_path}")
-    obj.put(Body=contents)
+    s3_client().put_object(
+        Bucket=IMAGE_BUCKET, Key=image_key(owner_id, image_path), Body=contents
+    )
 
     return ImageResponse(image_path=image_path)
 
 
+@router.post(
+    "/uploads",
+    status_code=status.HTTP_201_CREATED,
+    response_model=ImageUploadResponse,
+    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    summary="画像ファイルのアップロード先の発行",
+    description=(
+        "画像ファイルをS3へ直接アップロードするための署名付きPOSTの情報を発行します。"
+        "url に form_fields と画像ファイル(file)を multipart/form-data で送信した後、"
+        "画像ファイルのアップロード完了を呼び出してください。"
+        f"Content-Type は content_type と一致し、サイズは{IMAGE_MAX_BYTES}バイト以下である必要があります"
+    ),
+)
+def post_upload(
+    owner_id: str = Depends(owner_id_parameter),
+    request: ImageUploadRequest = Body(...),
+):
+    image_path = new_image_path(request.content_type)
+    expires_at = int(time.time()) + IMAGE_UPLOAD_EXPIRES_IN
+    presigned = s3_client().generate_presigned_post(
+        Bucket=IMAGE_BUCKET,
+        Key=image_key(owner_id, image_path),
+        Fields={"Content-Type": request.content_type},
+        Conditions=[
+            {"Content-Type": request.content_type},
+            ["content-length-range", 1, IMAGE_MAX_BYTES],
+        ],
+        ExpiresIn=IMAGE_UPLOAD_EXPIRES_IN,
+    )
+    return ImageUploadResponse(
+        image_path=image_path,
+        url=presigned["url"],
+        form_fields=presigned["fields"],
+        expires_at=expires_at,
+    )
+
+
+@router.post(
+    "/uploads/finalize",
+    response_model=ImageResponse,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
+    summary="画像ファイルのアップロード完了",
+    description=(
+        "S3へ直接アップロードした画像ファイルの先頭のバイト列とサイズを検証します。"
+        "画像パスの拡張子と形式が一致しない場合、サイズが上限を超える場合は画像ファイルを削除します"
+    ),
+)
+def finalize_upload(
+    owner_id: str = Depends(owner_id_parameter),
+    request: ImageFinalizeRequest = Body(...),
+):
+    key = image_key(owner_id, request.image_path)
+    try:
+        # 先頭のバイト列のみを取得し、全体のサイズは Content-Range から求める
+        obj = s3_client().get_object(
+            Bucket=IMAGE_BUCKET,
+            Key=key,
+            Range=f"bytes=0-{IMAGE_SIGNATURE_BYTES - 1}",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="image is not exist.",
+            )
+        raise e
+    head = obj["Body"].read()
+    size = int(obj.get("ContentRange", f"/{obj['ContentLength']}").split("/")[-1])
+
+    if not is_valid_image(request.image_path, head) or size > IMAGE_MAX_BYTES:
+        s3_client().delete_object(Bucket=IMAGE_BUCKET, Key=key)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="image data is invalid.",
+        )
+    return ImageResponse(image_path=request.image_path)
+
+
 @router.get(
     "/",
     response_description="画像データ(バイナリ)",
     response_class=Response,
     response_model_exclude_unset=True,
-    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    responses={
+        status.HTTP_200_OK: {"model": ImageUrlResponse},
+        status.HTTP_206_PARTIAL_CONTENT: {"description": "Range に指定した範囲の画像データ(バイナリ)"},
+        status.HTTP_302_FOUND: {"description": "画像データの取得URLへのリダイレクト"},
+        status.HTTP_304_NOT_MODIFIED: {
+            "description": "If-None-Match / If-Modified-Since の条件に一致する場合、本文なしで返却"
+        },
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+        status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE: {"model": Message},
+        status.HTTP_501_NOT_IMPLEMENTED: {"model": Message},
+    },
     summary="画像データの取得",
-    description="オーナーに紐付く画像データ(バイナリ)を取得します",
+    description=(
+        "オーナーに紐付く画像データ(バイナリ)を取得します。"
+        "delivery に url を指定した場合、または Accept に application/json を指定した場合は、"
+        "画像データの代わりに有効期限付きの取得URLを返却します。"
+        "delivery に redirect を指定した場合は、取得URLへリダイレクトします"
+        "(取得URLの場合、画像が存在しない場合もURLを返却します)。"
+        "画像データは ETag・Last-Modified 付きで返却し、If-None-Match / If-Modified-Since による条件付き取得、"
+        "Range による単一範囲の部分取得に対応します。"
+        "variant または w を指定した場合は縮小画像を返却します"
+        "(Accept に image/webp を含む場合は WebP、それ以外は JPEG。初回の取得時に生成して保存します。"
+        "縮小画像を生成できない環境では 501 を返却します)"
+    ),
 )
-def get(
-    owner_id: str = Depends(owner_id_parameter),
+async def get(
+    request: Request,
+    owner_id: str = Depends(owner_id_path),
     image_path: str = Depends(image_path_parameter),
+    delivery: Optional[str] = Query(
+        None,
+        regex="^(binary|url|redirect)$",
+        description="返却方法(binary:画像データ、url:取得URL、redirect:取得URLへのリダイレクト)",
+    ),
+    variant: Optional[str] = Query(
+        None,
+        regex="^(thumb|medium)$",
+        description=f"縮小画像の種類(長辺のピクセル数 {image.VARIANTS})",
+    ),
+    w: Optional[int] = Query(
+        None,
+        ge=1,
+        le=image.WIDTHS[-1],
+        description=f"縮小画像の長辺のピクセル数({image.WIDTHS} のいずれかに切り上げ)",
+    ),
 ):
+    accept = request.headers.get("accept", "")
+    key = image_key(owner_id, image_path)
+    width = image.variant_width(variant, w)
+    # 縮小画像を返却する場合の (長辺のピクセル数, 形式)
+    output: Optional[Tuple[int, str]] = None
+    if width is not None:
+        if not image.supported():
+            # Pillow がインストールされていない(サーバー側の構成の問題)
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="variant is not available.",
+            )
+        output = (width, image.output_format(accept))
 
-    try:
-        obj = s3.Object(IMAGE_BUCKET, f"{owner_id}/{image_path}")
-        bytes_image = obj.get()["Body"].read()
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "NoSuchKey":
+    if delivery is None and "application/json" in accept:
+        delivery = "url"
+    if delivery in ["url", "redirect"]:
+        await check_owner_async(owner_id)
+        if output is not None:
+            key = await variant_for_url(key, *output)
+        (url, expires_at) = image_url(key)
+        if delivery == "url":
+            return JSONResponse(
+                content=ImageUrlResponse(url=url, expires_at=expires_at).dict(),
+                headers={"Vary": "Accept"},
+            )
+        # リダイレクト先が同じURLである間は、ブラウザのキャッシュを利用させる
+        max_age = max(expires_at - int(time.time()) - IMAGE_URL_CACHE_MARGIN, 0)
+        return RedirectResponse(
+            url,
+            status_code=status.HTTP_302_FOUND,
+            headers={"Cache-Control": f"private, max-age={max_age}", "Vary": "Accept"},
+        )
+
+    # 条件付きリクエスト・範囲指定はそのまま S3 の GetObject へ渡す
+    conditions: Dict[str, Any] = {}
+    range_header = request.headers.get("range")
+    if range_header is not None and RANGE_PATTERN.match(range_header):
+        conditions["Range"] = range_header
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = parse_http_date(request.headers.get("if-modified-since"))
+    if if_none_match is not None:
+        conditions["IfNoneMatch"] = if_none_match
+    elif if_modified_since is not None:
+        conditions["IfModifiedSince"] = if_modified_since
+
+    def read() -> Dict[str, Any]:
+        if output is None:
+            target = key
+        else:
+            target = image.variant_key(key, *output)
+        try:
+            obj = s3_client().get_object(Bucket=IMAGE_BUCKET, Key=target, **conditions)
+        except ClientError as e:
+            if output is None or e.response["Error"]["Code"] != "NoSuchKey":
+                raise e
+            # 縮小画像が未生成の場合は、生成した画像をそのまま返却する
+            return create_variant(key, *output)
+        obj["Body"] = obj["Body"].read()
+        return obj
+
+    # オーナーの存在確認と画像の取得を並行して行い、オーナーの確認結果を優先して返却する
+    (owner, obj) = await asyncio.gather(
+        check_owner_async(owner_id), repository.run(read), return_exceptions=True
+    )
+    if isinstance(owner, Exception):
+        raise owner
+    if isinstance(obj, ClientError):
+        if obj.response["ResponseMetadata"]["HTTPStatusCode"] == 304:
+            # 本文は取得されていない
+            metadata = obj.response["ResponseMetadata"]["HTTPHeaders"]
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers=image_headers(
+                    {
+                        "ETag": metadata.get("etag"),
+                        "LastModified": metadata.get("last-modified"),
+                    }
+                ),
+            )
+        if obj.response["Error"]["Code"] == "NoSuchKey":
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="image is not exist.",
             )
-        else:
-            raise e
+        if obj.response["Error"]["Code"] == "InvalidRange":
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="range is not satisfiable.",
+            )
+    if isinstance(obj, image.InvalidImageError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="image data is invalid.",
+        )
+    if isinstance(obj, BaseException):
+        raise obj
 
-    extension = image_path.split(".")[-1]
+    headers = image_headers(obj)
+    if output is None:
+        media_type = f"image/{image_path.split('.')[-1]}"
+    else:
+        media_type = image.MEDIA_TYPES[output[1]]
     return Response(
-        content=bytes_image,
-        media_type=f"image/{extension}",
-        headers={"content-type": f"image/{extension}"},
+        content=obj["Body"],
+        status_code=status.HTTP_206_PARTIAL_CONTENT
+        if "ContentRange" in obj
+        else status.HTTP_200_OK,
+        media_type=media_type,
+        headers=headers,
     )
 
 
@@ -113,11 +394,148 @@ def delete(
     owner_id: str = Depends(owner_id_parameter),
     image_path: str = Depends(image_path_parameter),
 ):
+    key = image_key(owner_id, image_path)
     try:
-        obj = s3.Object(IMAGE_BUCKET, f"{owner_id}/{image_path}")
-        obj.delete()
+        s3_client().delete_object(Bucket=IMAGE_BUCKET, Key=key)
     except ClientError as e:
         if e.response["Error"]["Code"] != "NoSuchKey":
             raise e
+    image_url_cache.invalidate(key)
+
+    # 生成済みの縮小画像も削除する
+    variants = s3_client().list_objects_v2(
+        Bucket=IMAGE_BUCKET, Prefix=image.variant_prefix(key)
+    )
+    keys = [x["Key"] for x in variants.get("Contents", [])]
+    if keys:
+        s3_client().delete_objects(
+            Bucket=IMAGE_BUCKET,
+            Delete={"Objects": [{"Key": x} for x in keys], "Quiet": True},
+        )
+    for variant_key in keys:
+        image_url_cache.invalidate(variant_key)
 
     return EmptyResponse()
+
+
+def image_key(owner_id: str, image_path: str) -> str:
+    return f"{owner_id}/{image_path}"
+
+
+def image_url(key: str) -> Tuple[str, int]:
+    """画像データの取得URLとその有効期限(unixtime)
+
+    同じ画像には期限切れ間際まで同じURLを返却し、署名の生成を省くとともにブラウザのキャッシュを効かせる。
+    """
+    cached = image_url_cache.get(key)
+    if cached is not None:
+        return cached
+
+    expires_at = int(time.time()) + IMAGE_URL_EXPIRES_IN
+    url = s3_client().generate_presigned_url(
+        "get_object",
+        Params={"Bucket": IMAGE_BUCKET, "Key": key},
+        ExpiresIn=IMAGE_URL_EXPIRES_IN,
+    )
+    image_url_cache.set(key, (url, expires_at))
+    return (url, expires_at)
+
+
+def new_image_path(content_type: str) -> str:
+    now = datetime.now()
+    id = f"{str(uuid.uuid4()).replace('-', '')}.{content_type.split('/')[-1]}"
+    return f'{now.strftime("%Y")}{now.strftime("%m")}{now.strftime("%d")}/{now.strftime("%H")}/{id}'
+
+
+def is_valid_image(image_path: str, head: bytes) -> bool:
+    """画像パスの拡張子が示す形式と、ファイル先頭のバイト列が一致するか"""
+    signatures = IMAGE_SIGNATURES.get(f"image/{image_path.split('.')[-1]}", [])
+    return any(head.startswith(x) for x in signatures)
+
+
+def image_headers(obj: Dict[str, Any]) -> Dict[str, str]:
+    """S3 のオブジェクト情報から、画像データのレスポンスヘッダを生成する
+
+    画像パスは登録の度に新しく採番され、同じパスの内容は変わらないため、長期間のキャッシュを許可する。
+    同じURLでも Accept により取得URL(JSON)・縮小画像の形式が変わるため、キャッシュを Accept ごとに分ける。
+    """
+    headers = {
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept",
+    }
+    if obj.get("ETag") is not None:
+        headers["ETag"] = obj["ETag"]
+    last_modified = obj.get("LastModified")
+    if isinstance(last_modified, datetime):
+        # botocore の日時は dateutil の tzutc を持つため、usegmt が受け付ける UTC へ変換する
+        headers["Last-Modified"] = format_datetime(
+            last_modified.astimezone(timezone.utc), usegmt=True
+        )
+    elif last_modified is not None:
+        headers["Last-Modified"] = last_modified
+    if obj.get("ContentRange") is not None:
+        headers["Content-Range"] = obj["ContentRange"]
+    return headers
+
+
+def parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def create_variant(key: str, width: int, format: str) -> Dict[str, Any]:
+    """元画像から縮小画像を生成して保存する(GetObject と同じ形式で返却する)"""
+    original = s3_client().get_object(Bucket=IMAGE_BUCKET, Key=key)
+    if original["ContentLength"] > IMAGE_MAX_BYTES:
+        original["Body"].close()
+        raise image.InvalidImageError(
+            f"image is too large: {original['ContentLength']}"
+        )
+    data = image.resize(original["Body"].read(), width, format)
+    result = s3_client().put_object(
+        Bucket=IMAGE_BUCKET,
+        Key=image.variant_key(key, width, format),
+        Body=data,
+        ContentType=image.MEDIA_TYPES[format],
+    )
+    return {
+        "Body": data,
+        "ETag": result["ETag"],
+        "LastModified": datetime.now(timezone.utc),
+    }
+
+
+def ensure_variant(key: str, width: int, format: str) -> str:
+    """縮小画像が未生成の場合は生成し、そのキーを返却する"""
+    target = image.variant_key(key, width, format)
+    if image_url_cache.get(target) is not None:
+        return target
+    try:
+        s3_client().head_object(Bucket=IMAGE_BUCKET, Key=target)
+    except ClientError as e:
+        if e.response["ResponseMetadata"]["HTTPStatusCode"] != 404:
+            raise e
+        create_variant(key, width, format)
+    return target
+
+
+async def variant_for_url(key: str, width: int, format: str) -> str:
+    try:
+        return await repository.run(ensure_variant, key, width, format)
+    except image.InvalidImageError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="image data is invalid.",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="image is not exist.",
+            )
+        raise e
@@ -1,4 +1,8 @@
-from pydantic import BaseModel
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, constr
+
+Id = constr(regex="^[a-z0-9]{32}$")
 
 
 class Message(BaseModel):
@@ -7,3 +11,11 @@ class Message(BaseModel):
 
 class EmptyResponse(BaseModel):
     pass
+
+
+class DeleteResponse(BaseModel):
+    deleted_events: Optional[int] = Field(None, title="同時に削除したイベント情報の件数、cascade指定時のみ返却")
+
+
+class OrderRequest(BaseModel):
+    ids: List[Id] = Field(..., title="画面表示順に並べたIDの一覧", min_items=1)  # type: ignore
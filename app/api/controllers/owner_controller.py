@@ -1,5 +1,6 @@
 import uuid
 
+from app.api.controllers.common import owner_cache
 from app.api.controllers.model import Message
 from app.custom_logging import CustomLogger
 from app.models.owner_model import OwnerModel
@@ -45,6 +46,7 @@ def post(request: OwnerRequest) -> OwnerResponse:
 
     model = request.to_model()
     model.save()
+    owner_cache.invalidate(model.id)
     return OwnerResponse.from_model(model)
 
 
@@ -56,7 +58,7 @@ def post(request: OwnerRequest) -> OwnerResponse:
     description="メールアドレスでオーナー情報を検索します",
 )
 def search(email: EmailStr = Query(..., description="メールアドレス")) -> OwnerResponse:
-    for model in OwnerModel.scan(OwnerModel.email == email, limit=1):
+    for model in OwnerModel.email_index.query(hash_key=email, limit=1):
         return OwnerResponse.from_model(model)
 
     raise HTTPException(
@@ -66,6 +68,6 @@ def search(email: EmailStr = Query(..., description="メールアドレス")) ->
 
 
 def is_email_exists(email: str) -> bool:
-    for model in OwnerModel.scan(OwnerModel.email == email, limit=1):
+    for model in OwnerModel.email_index.query(hash_key=email, limit=1):
         return True
     return False
@@ -1,15 +1,49 @@
 import uuid
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, List, Optional, Union
 
-from app.api.controllers.common import owner_id_parameter
-from app.api.controllers.model import EmptyResponse, Message
+from app.api.controllers.common import (
+    NEXT_CURSOR_RESPONSE,
+    NOT_MODIFIED_RESPONSE,
+    check_etag,
+    compact_orders,
+    cursor_parameter,
+    delete_events,
+    delete_unique,
+    fields_parameter,
+    fields_response,
+    is_condition_failed,
+    is_item_exists,
+    limit_parameter,
+    list_etag,
+    owner_id_parameter,
+    projection,
+    reference_cache,
+    resource_etag,
+    save_unique,
+    select_fields,
+    set_next_cursor,
+    update_item,
+    update_unique_item,
+    validate_order_ids,
+    version_condition,
+    write_orders,
+)
+from app.api.controllers.model import (
+    DeleteResponse,
+    EmptyResponse,
+    Message,
+    OrderRequest,
+)
 from app.custom_logging import CustomLogger
+from app.models.event_model import EventModel
 from app.models.task_model import TaskModel
-from fastapi import APIRouter, status
+from app.models.unique_model import UniqueModel
+from fastapi import APIRouter, Request, Response, status
 from fastapi.exceptions import HTTPException
-from fastapi.param_functions import Body, Depends, Path
+from fastapi.param_functions import Body, Depends, Header, Path, Query
 from pydantic import BaseModel, Field
+from pynamodb.exceptions import TransactWriteError
 from starlette.status import HTTP_404_NOT_FOUND
 
 router = APIRouter()
@@ -35,6 +69,13 @@ class TaskRequest(BaseModel):
         return model
 
 
+class TaskPatchRequest(BaseModel):
+    icon_no: Optional[int] = Field(None, title="アイコンNo")
+    title: Optional[str] = Field(None, title="タイトル")
+    order: Optional[int] = Field(None, title="画面表示順", ge=1)
+    enabled: Optional[bool] = Field(None, title="有効フラグ")
+
+
 class TaskResponse(TaskRequest):
     id: str = Field(..., title="タスクID")
     updated_at: int = Field(..., title="更新日時(unixtime)")
@@ -67,21 +108,43 @@ def task_id_parameter(
     "/",
     response_model=List[TaskResponse],
     response_model_exclude_unset=True,
-    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    responses={
+        status.HTTP_200_OK: NEXT_CURSOR_RESPONSE,
+        status.HTTP_304_NOT_MODIFIED: NOT_MODIFIED_RESPONSE,
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
     summary="タスク情報の一覧取得",
-    description="オーナーに紐付くタスク情報の一覧を取得します",
+    description=(
+        "オーナーに紐付くタスク情報の一覧を、画面表示順に並べて取得します。"
+        "limitを指定した場合はID順にページングされ、画面表示順での並べ替えはページ内でのみ行われます。"
+        "続きがある場合はレスポンスヘッダ X-Next-Cursor の値を cursor に指定して次ページを取得します"
+    ),
 )
 def list(
+    request: Request,
+    response: Response,
     owner_id: str = Depends(owner_id_parameter),
-) -> List[TaskResponse]:
-    tasks = [x for x in TaskModel.query(hash_key=owner_id)]
-    tasks.sort(key=lambda x: x.order)
-    for (idx, task) in enumerate(tasks):
-        if idx + 1 == task.order:
-            continue
-        task.order = idx + 1
-        task.save()
-
+    limit: Optional[int] = Depends(limit_parameter),
+    cursor: Optional[Dict[str, Any]] = Depends(cursor_parameter),
+    fields: Optional[List[str]] = Depends(fields_parameter(TaskResponse)),
+) -> Union[List[TaskResponse], Response]:
+    models = TaskModel.query(
+        hash_key=owner_id,
+        limit=limit,
+        last_evaluated_key=cursor,
+        attributes_to_get=projection(fields, "task_id", "order", "version"),
+    )
+    tasks = sorted(models, key=lambda x: x.order)
+    set_next_cursor(response, models.last_evaluated_key)
+    etag = list_etag(request, [(x.task_id, x.version, x.order) for x in tasks])
+    not_modified = check_etag(request, response, etag)
+    if not_modified is not None:
+        return not_modified
+    if fields is not None:
+        return fields_response(
+            response, [select_fields(x, fields, "task_id") for x in tasks]
+        )
     return [TaskResponse.from_model(x) for x in tasks]
 
 
@@ -89,17 +152,26 @@ def list(
     "/{id}",
     response_model=TaskResponse,
     response_model_exclude_unset=True,
-    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+    responses={
+        status.HTTP_304_NOT_MODIFIED: NOT_MODIFIED_RESPONSE,
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
     summary="タスク情報の1件取得",
     description="オーナーに紐付くタスク情報を1件取得します",
 )
 def get(
+    request: Request,
+    response: Response,
     owner_id: str = Depends(owner_id_parameter),
     task_id: str = Depends(task_id_parameter),
-) -> TaskResponse:
+    fields: Optional[List[str]] = Depends(fields_parameter(TaskResponse)),
+) -> Union[TaskResponse, Response]:
     try:
-        return TaskResponse.from_model(
-            TaskModel.get(hash_key=owner_id, range_key=task_id)
+        model = TaskModel.get(
+            hash_key=owner_id,
+            range_key=task_id,
+            attributes_to_get=projection(fields, "task_id", "version"),
         )
     except TaskModel.DoesNotExist:
         raise HTTPException(
@@ -107,6 +179,13 @@ def get(
             detail="task not found.",
         )
 
+    not_modified = check_etag(request, response, resource_etag(model.version))
+    if not_modified is not None:
+        return not_modified
+    if fields is not None:
+        return fields_response(response, select_fields(model, fields, "task_id"))
+    return TaskResponse.from_model(model)
+
 
 @router.post(
     "/",
@@ -124,22 +203,61 @@ def post(
     owner_id: str = Depends(owner_id_parameter),
     request: TaskRequest = Body(...),
 ) -> TaskResponse:
-    if is_title_exists(owner_id, request.title):
+    model = request.to_model(owner_id)
+    try:
+        save_unique(model, UniqueModel.task_title(owner_id, model.title))
+    except TransactWriteError as e:
+        if not is_condition_failed(e):
+            raise e
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="title is already exists.",
         )
-
-    model = request.to_model(owner_id)
-    model.save()
+    reference_cache.invalidate(("task", owner_id))
     return TaskResponse.from_model(model)
 
 
+@router.put(
+    "/order",
+    response_model=EmptyResponse,
+    response_model_exclude_unset=True,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+    },
+    summary="タスク情報の表示順の一括更新",
+    description="オーナーに紐付く全てのタスク情報のIDを画面表示順に並べて指定し、表示順を一括更新します",
+)
+def put_order(
+    owner_id: str = Depends(owner_id_parameter),
+    request: OrderRequest = Body(...),
+) -> EmptyResponse:
+    validate_order_ids(TaskModel, TaskModel.task_id, owner_id, request.ids)
+
+    models = [
+        TaskModel(owner_id, task_id, order=idx + 1)
+        for (idx, task_id) in enumerate(request.ids)
+    ]
+    try:
+        write_orders(models, TaskModel.task_id)
+    except TransactWriteError as e:
+        if not is_condition_failed(e):
+            raise e
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="illegal task id.",
+        )
+    return EmptyResponse()
+
+
 @router.put(
     "/{id}",
     response_model=TaskResponse,
     response_model_exclude_unset=True,
-    responses={status.HTTP_400_BAD_REQUEST: {"model": Message}},
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_412_PRECONDITION_FAILED: {"model": Message},
+    },
     summary="タスク情報の更新",
     description="オーナーに紐付くタスク情報を更新します",
 )
@@ -155,34 +273,107 @@ def put(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="task not found.",
         )
+    previous = UniqueModel.task_title(owner_id, model.title)
     for (key, value) in request.dict().items():
         setattr(model, key, value)
     model.updated_at = int(datetime.timestamp(datetime.now()))
-    model.save()
+    version = model.version
+    model.version = version + 1
+    unique = UniqueModel.task_title(owner_id, model.title)
+    try:
+        save_unique(model, unique, previous, version_condition(TaskModel, version))
+    except TransactWriteError as e:
+        if not is_condition_failed(e):
+            raise e
+        if unique.id != previous.id and is_item_exists(UniqueModel, unique.id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="title is already exists.",
+            )
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="precondition failed.",
+        )
+    return TaskResponse.from_model(model)
+
+
+@router.patch(
+    "/{id}",
+    response_model=TaskResponse,
+    response_model_exclude_unset=True,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": Message},
+        status.HTTP_404_NOT_FOUND: {"model": Message},
+        status.HTTP_412_PRECONDITION_FAILED: {"model": Message},
+    },
+    summary="タスク情報の部分更新",
+    description=(
+        "オーナーに紐付くタスク情報のうち、指定された項目のみを更新します。"
+        "If-Match に取得時のETagを指定した場合、その後に更新されていないときのみ更新します"
+    ),
+)
+def patch(
+    response: Response,
+    owner_id: str = Depends(owner_id_parameter),
+    task_id: str = Depends(task_id_parameter),
+    if_match: Optional[str] = Header(None, description="取得時のETag"),
+    request: TaskPatchRequest = Body(...),
+) -> TaskResponse:
+    changes = request.dict(exclude_unset=True)
+    if "title" not in changes:
+        model = TaskModel(owner_id, task_id)
+        update_item(model, TaskModel.task_id, changes, if_match, "task not found.")
+    else:
+        try:
+            model = TaskModel.get(hash_key=owner_id, range_key=task_id)
+        except TaskModel.DoesNotExist:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="task not found.",
+            )
+        update_unique_item(
+            model,
+            TaskModel.task_id,
+            changes,
+            if_match,
+            UniqueModel.task_title(owner_id, changes["title"]),
+            UniqueModel.task_title(owner_id, model.title),
+            "title is already exists.",
+        )
+
+    response.headers["ETag"] = resource_etag(model.version)
     return TaskResponse.from_model(model)
 
 
 @router.delete(
     "/{id}",
-    response_model=EmptyResponse,
+    response_model=DeleteResponse,
     response_model_exclude_unset=True,
     responses={status.HTTP_400_BAD_REQUEST: {"model": Message}},
     summary="タスク情報の削除",
-    description="オーナーに紐付くタスク情報を削除します",
+    description="オーナーに紐付くタスク情報を削除します。cascadeを指定した場合、タスク情報に紐付くイベント情報も削除し、その件数を返却します",
 )
 def delete(
     owner_id: str = Depends(owner_id_parameter),
     task_id: str = Depends(task_id_parameter),
-) -> EmptyResponse:
-    for model in TaskModel.query(
-        hash_key=owner_id, range_key_condition=TaskModel.task_id == task_id
-    ):
-        model.delete()
-    return EmptyResponse()
+    cascade: bool = Query(False, description="紐付くイベント情報も削除する"),
+) -> DeleteResponse:
+    model = delete_unique(
+        TaskModel,
+        owner_id,
+        task_id,
+        lambda x: UniqueModel.task_title(owner_id, x.title),
+    )
+    if model is not None:
+        reference_cache.invalidate(("task", owner_id))
+        compact_orders(TaskModel, TaskModel.task_id, owner_id)
 
-
-def is_title_exists(owner_id: str, title: str) -> bool:
-    for model in TaskModel.query(hash_key=owner_id):
-        if model.title == title:
-            return True
-    return False
+    if cascade:
+        count = delete_events(
+            owner_id,
+            EventModel.task_timestamp_index,
+            EventModel.task_timestamp,
+            task_id,
+        )
+        return DeleteResponse(deleted_events=count)
+    return DeleteResponse()
@@ -1,11 +1,25 @@
 import time
 from datetime import datetime, timedelta, timezone
 
-from app.api.router import router
+from app.api.compression import SelectiveGZipMiddleware
+from app.api.controllers.common import (
+    NEXT_CURSOR_HEADER,
+    owner_cache,
+    reference_cache,
+)
+from app.api.controllers.image_controller import image_url_cache
+from app.api.openapi import (
+    OPENAPI_PREBUILT,
+    OPENAPI_URL,
+    PrebuiltOpenAPIMiddleware,
+)
+from app.api.router import include_routers
+from app.client_config import pool_stats
 from app.custom_logging import CustomLogger
+from app.models.connection import warm_up
 from fastapi import FastAPI, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.openapi.docs import get_swagger_ui_html
 from mangum import Mangum
 
 JST = timezone(timedelta(hours=9), "JST")
@@ -16,6 +30,8 @@ app = FastAPI(
     description="Animals event management tool",
     version="1.0.0",
     redoc_url=None,
+    # 生成済みのドキュメントを返却する場合は、実行時のスキーマ生成を行わない
+    openapi_url=None if OPENAPI_PREBUILT else OPENAPI_URL,
     servers=[
         {
             "url": "http://localhost:5000",
@@ -28,17 +44,28 @@ app = FastAPI(
         {"url": "https://bow-api.jozuo.work", "description": "Production environment"},
     ],
 )
+# 後から追加したミドルウェアほど外側で処理する
+# (生成済みの /openapi.json は圧縮済みのため、SelectiveGZipMiddleware の外側で返却する)
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=1000)
+if OPENAPI_PREBUILT:
+    app.add_middleware(PrebuiltOpenAPIMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
-app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 
-app.include_router(router=router, prefix="")
+include_routers(app)
+
+
+@app.on_event("startup")
+async def warm_up_connections():
+    # コールドスタート直後のリクエストが接続の確立(TLSハンドシェイク)を待たないようにする
+    await warm_up()
 
 
 @app.get("/", include_in_schema=False)
@@ -46,9 +73,25 @@ def root():
     return {}
 
 
+if OPENAPI_PREBUILT:
+
+    @app.get("/docs", include_in_schema=False)
+    def get_docs():
+        return get_swagger_ui_html(
+            openapi_url=OPENAPI_URL, title=f"{app.title} - Swagger UI"
+        )
+
+
 @app.get("/status", include_in_schema=False)
 def get_status():
-    return {}
+    return {
+        "caches": {
+            "owner": owner_cache.stats(),
+            "reference": reference_cache.stats(),
+            "image_url": image_url_cache.stats(),
+        },
+        "pools": {name: stats.stats() for (name, stats) in pool_stats.items()},
+    }
 
 
 @app.middleware("http")
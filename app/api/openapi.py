@@ -0,0 +1,74 @@
+"""OpenAPI ドキュメント(oas/bow.json)の生成と配信
+
+FastAPI は /openapi.json の初回アクセス時に全ルートの pydantic モデルからスキーマを生成するため、
+コールドスタートの度にその処理が発生する。
+OPENAPI_PREBUILT が有効な場合は、ビルド時に生成した oas/bow.json を圧縮済みのバイト列で返却する。
+"""
+import gzip
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from fastapi import FastAPI
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.api.compression import accepts_gzip
+
+OAS_PATH = Path(__file__).resolve().parents[2] / "oas" / "bow.json"
+OPENAPI_PREBUILT = os.environ.get("OPENAPI_PREBUILT", "false").lower() == "true"
+OPENAPI_URL = "/openapi.json"
+
+
+def generate(app: FastAPI) -> Dict[str, Any]:
+    def normalize(value: Any) -> Any:
+        # oas/bow.json は jq で整形していたため、整数値の float は整数として出力する
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, dict):
+            return {k: normalize(v) for (k, v) in value.items()}
+        if isinstance(value, list):
+            return [normalize(x) for x in value]
+        return value
+
+    return normalize(app.openapi())
+
+
+def dumps(schema: Dict[str, Any]) -> str:
+    return json.dumps(schema, indent=2, ensure_ascii=False) + "\n"
+
+
+@lru_cache(maxsize=None)
+def prebuilt_document() -> Tuple[bytes, bytes]:
+    """oas/bow.json の内容とその gzip 圧縮結果"""
+    # 改行・インデントを除いて転送量を減らす
+    body = json.dumps(
+        json.loads(OAS_PATH.read_bytes()), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    return (body, gzip.compress(body, compresslevel=9))
+
+
+class PrebuiltOpenAPIMiddleware:
+    """/openapi.json へのリクエストに oas/bow.json を返却する
+
+    SelectiveGZipMiddleware の外側に配置し、圧縮済みのバイト列を再圧縮させない。
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] != OPENAPI_URL:
+            await self.app(scope, receive, send)
+            return
+
+        (body, compressed) = prebuilt_document()
+        headers = {"Vary": "Accept-Encoding"}
+        if accepts_gzip(Headers(scope=scope).get("Accept-Encoding", "")):
+            body = compressed
+            headers["Content-Encoding"] = "gzip"
+        response = Response(body, media_type="application/json", headers=headers)
+        await response(scope, receive, send)
@@ -5,7 +5,7 @@ from app.api.controllers import (
     owner_controller,
     task_controller,
 )
-from fastapi import APIRouter, Security
+from fastapi import FastAPI, Security
 from fastapi.security.api_key import APIKeyHeader
 
 api_key_authorization = Security(
@@ -16,34 +16,22 @@ api_key_authorization = Security(
 )
 
 
-router = APIRouter()
-router.include_router(
-    owner_controller.router,
-    prefix="/owners",
-    tags=["owner"],
-    dependencies=[api_key_authorization],
-)
-router.include_router(
-    dog_controller.router,
-    prefix="/owners/{owner_id}/dogs",
-    tags=["dogs"],
-    dependencies=[api_key_authorization],
-)
-router.include_router(
-    image_controller.router,
-    prefix="/owners/{owner_id}/images",
-    tags=["images"],
-    dependencies=[api_key_authorization],
-)
-router.include_router(
-    task_controller.router,
-    prefix="/owners/{owner_id}/tasks",
-    tags=["tasks"],
-    dependencies=[api_key_authorization],
-)
-router.include_router(
-    event_controller.router,
-    prefix="/owners/{owner_id}/events",
-    tags=["events"],
-    dependencies=[api_key_authorization],
-)
+# 各コントローラのルーターをアプリケーションへ直接登録する
+# (APIRouter を経由すると include_router の度にルートが複製され、起動時間が増えるため)
+ROUTERS = [
+    (owner_controller.router, "/owners", "owner"),
+    (dog_controller.router, "/owners/{owner_id}/dogs", "dogs"),
+    (image_controller.router, "/owners/{owner_id}/images", "images"),
+    (task_controller.router, "/owners/{owner_id}/tasks", "tasks"),
+    (event_controller.router, "/owners/{owner_id}/events", "events"),
+]
+
+
+def include_routers(app: FastAPI) -> None:
+    for (router, prefix, tag) in ROUTERS:
+        app.include_router(
+            router,
+            prefix=prefix,
+            tags=[tag],
+            dependencies=[api_key_authorization],
+        )
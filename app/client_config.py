@@ -0,0 +1,143 @@
+"""DynamoDB(PynamoDB)・S3 クライアントの接続設定
+
+全モデルの Meta と S3 クライアントで同じ接続プール・タイムアウト・リトライ設定を共有する。
+設定値は環境変数で上書きできる。
+
+PynamoDB は botocore の Config を内部で生成し、リトライも独自に行うため、
+DynamoDB 向けには Meta の属性(max_pool_connections など)として設定を渡す。
+"""
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Dict
+
+from botocore.config import Config
+
+REGION = "ap-northeast-1"
+DYNAMODB_HOST = "http://localhost:8000" if os.environ.get("IS_OFFLINE") else None
+# ローカル実行時の S3 互換エンドポイント(未指定の場合は AWS の S3 へ接続する)
+S3_HOST = os.environ.get("S3_ENDPOINT") if os.environ.get("IS_OFFLINE") else None
+
+MAX_POOL_CONNECTIONS = int(os.environ.get("CLIENT_MAX_POOL_CONNECTIONS", "20"))
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get("CLIENT_CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT_SECONDS = float(os.environ.get("CLIENT_READ_TIMEOUT", "10"))
+MAX_RETRY_ATTEMPTS = int(os.environ.get("CLIENT_MAX_RETRY_ATTEMPTS", "3"))
+BASE_BACKOFF_MS = int(os.environ.get("CLIENT_BASE_BACKOFF_MS", "25"))
+RETRY_MODE = os.environ.get("CLIENT_RETRY_MODE", "standard")
+TCP_KEEPALIVE = os.environ.get("CLIENT_TCP_KEEPALIVE", "true").lower() == "true"
+
+
+class ModelMeta:
+    """各モデルの Meta が継承する接続設定"""
+
+    region = REGION
+    host = DYNAMODB_HOST
+    max_pool_connections = MAX_POOL_CONNECTIONS
+    connect_timeout_seconds = CONNECT_TIMEOUT_SECONDS
+    read_timeout_seconds = READ_TIMEOUT_SECONDS
+    max_retry_attempts = MAX_RETRY_ATTEMPTS
+    base_backoff_ms = BASE_BACKOFF_MS
+
+
+def connection_kwargs() -> Dict[str, Any]:
+    """pynamodb.connection.Connection の生成引数"""
+    return {
+        "region": ModelMeta.region,
+        "host": ModelMeta.host,
+        "max_pool_connections": ModelMeta.max_pool_connections,
+        "connect_timeout_seconds": ModelMeta.connect_timeout_seconds,
+        "read_timeout_seconds": ModelMeta.read_timeout_seconds,
+        "max_retry_attempts": ModelMeta.max_retry_attempts,
+        "base_backoff_ms": ModelMeta.base_backoff_ms,
+    }
+
+
+def boto_config() -> Config:
+    return Config(
+        region_name=REGION,
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        connect_timeout=CONNECT_TIMEOUT_SECONDS,
+        read_timeout=READ_TIMEOUT_SECONDS,
+        retries={"mode": RETRY_MODE, "max_attempts": MAX_RETRY_ATTEMPTS},
+        tcp_keepalive=TCP_KEEPALIVE,
+    )
+
+
+class PoolStats:
+    """クライアント単位の同時リクエスト数の計測
+
+    同時実行数が接続プールの上限に達した状態で開始されたリクエストを saturated として数える。
+    (botocore は上限を超えた分の接続を都度生成・破棄するため、ハンドシェイクが発生する)
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.requests = 0
+        self.in_use = 0
+        self.peak = 0
+        self.saturated = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self.in_use >= self.maxsize:
+                self.saturated += 1
+            self.requests += 1
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "maxsize": self.maxsize,
+                "requests": self.requests,
+                "in_use": self.in_use,
+                "peak": self.peak,
+                "saturated": self.saturated,
+            }
+
+
+pool_stats: Dict[str, PoolStats] = {}
+
+
+def instrument(name: str, client: Any) -> Any:
+    """botocore クライアントの HTTP 送信を計測対象にする
+
+    PynamoDB は botocore の API 呼び出しを経由せず http_session.send を直接呼ぶため、
+    送信処理そのものを置き換えて計測する。クライアントが再生成された場合は同じ名前の計測値へ合算する。
+    """
+    http_session = client._endpoint.http_session
+    send = http_session.send
+    if getattr(send, "pool_stats", None) is not None:
+        return client
+    stats = pool_stats.get(name)
+    if stats is None:
+        stats = pool_stats[name] = PoolStats(client.meta.config.max_pool_connections)
+
+    def instrumented_send(request):
+        stats.acquire()
+        try:
+            return send(request)
+        finally:
+            stats.release()
+
+    instrumented_send.pool_stats = stats  # type: ignore
+    http_session.send = instrumented_send
+    return client
+
+
+@lru_cache(maxsize=None)
+def s3_client():
+    """プロセス内で共有する S3 クライアント
+
+    boto3 の import とクライアントの生成は初回の利用時に行う。
+    """
+    import boto3
+
+    return instrument(
+        "s3", boto3.client("s3", endpoint_url=S3_HOST, config=boto_config())
+    )
@@ -0,0 +1,132 @@
+import csv
+import gzip
+import io
+from array import array
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import IO, Dict, Iterable, List, cast
+
+from app.models.event_model import EventModel
+
+CSV_GZ = "csv.gz"
+ARROW = "arrow"
+MEDIA_TYPES = {
+    CSV_GZ: "application/gzip",
+    ARROW: "application/vnd.apache.arrow.file",
+}
+
+
+@lru_cache(maxsize=None)
+def supported_formats() -> List[str]:
+    # pyarrow は import に時間がかかるため、Arrow形式での出力時まで読み込まない
+    return [CSV_GZ, ARROW] if find_spec("pyarrow") is not None else [CSV_GZ]
+
+
+@lru_cache(maxsize=None)
+def load_pyarrow():
+    import pyarrow
+    import pyarrow.ipc
+
+    return pyarrow
+
+
+class DictionaryColumn:
+    """値を辞書とその添字(int32)で保持する列
+
+    犬ID・タスクIDのように種類の少ない32文字のIDを、行ごとに保持しないために利用する。
+    """
+
+    def __init__(self) -> None:
+        self.values: List[str] = []
+        self.codes = array("i")
+        self._index: Dict[str, int] = {}
+
+    def append(self, value: str) -> None:
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+
+class EventColumns:
+    """イベント情報を列ごとの型付き配列で保持する
+
+    クエリ結果を1件ずつ取り込むため、モデルの一覧を保持せずに済む。
+    """
+
+    def __init__(self) -> None:
+        self.event_ids: List[str] = []
+        self.timestamps = array("q")
+        self.updated_ats = array("q")
+        self.dog_ids = DictionaryColumn()
+        self.task_ids = DictionaryColumn()
+
+    def __len__(self) -> int:
+        return len(self.event_ids)
+
+    @classmethod
+    def from_models(cls, models: Iterable[EventModel]) -> "EventColumns":
+        columns = cls()
+        for model in models:
+            columns.event_ids.append(model.event_id)
+            columns.timestamps.append(model.timestamp)
+            columns.updated_ats.append(model.updated_at)
+            columns.dog_ids.append(model.dog_id)
+            columns.task_ids.append(model.task_id)
+        return columns
+
+    def write_csv_gz(self, fileobj: IO[bytes]) -> None:
+        with gzip.GzipFile(fileobj=fileobj, mode="wb") as compressed:
+            with io.TextIOWrapper(
+                cast(IO[bytes], compressed), encoding="utf-8", newline=""
+            ) as text:
+                writer = csv.writer(text)
+                writer.writerow(["id", "timestamp", "dog_id", "task_id", "updated_at"])
+                dogs = self.dog_ids.values
+                tasks = self.task_ids.values
+                writer.writerows(
+                    zip(
+                        self.event_ids,
+                        self.timestamps,
+                        (dogs[x] for x in self.dog_ids.codes),
+                        (tasks[x] for x in self.task_ids.codes),
+                        self.updated_ats,
+                    )
+                )
+
+    def write_arrow(self, fileobj: IO[bytes]) -> None:
+        pyarrow = load_pyarrow()
+        table = pyarrow.table(
+            {
+                "id": pyarrow.array(self.event_ids, pyarrow.string()),
+                "timestamp": self._numeric_array(self.timestamps, pyarrow.int64()),
+                "dog_id": self._dictionary_array(self.dog_ids),
+                "task_id": self._dictionary_array(self.task_ids),
+                "updated_at": self._numeric_array(self.updated_ats, pyarrow.int64()),
+            }
+        )
+        options = pyarrow.ipc.IpcWriteOptions(compression="zstd")
+        with pyarrow.ipc.new_file(fileobj, table.schema, options=options) as writer:
+            writer.write_table(table)
+
+    def write(self, format: str, fileobj: IO[bytes]) -> None:
+        if format == ARROW:
+            self.write_arrow(fileobj)
+        else:
+            self.write_csv_gz(fileobj)
+
+    @staticmethod
+    def _numeric_array(values: array, type):
+        pyarrow = load_pyarrow()
+        # array の内部バッファをそのまま Arrow の列として参照する(要素ごとの変換を行わない)
+        buffer = pyarrow.py_buffer(values)
+        return pyarrow.Array.from_buffers(type, len(values), [None, buffer])
+
+    @classmethod
+    def _dictionary_array(cls, column: DictionaryColumn):
+        pyarrow = load_pyarrow()
+        return pyarrow.DictionaryArray.from_arrays(
+            cls._numeric_array(column.codes, pyarrow.int32()),
+            pyarrow.array(column.values, pyarrow.string()),
+        )
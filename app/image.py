@@ -0,0 +1,94 @@
+import io
+import os
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Optional
+
+WEBP = "webp"
+JPEG = "jpeg"
+MEDIA_TYPES = {WEBP: "image/webp", JPEG: "image/jpeg"}
+
+# 縮小画像の長辺のピクセル数
+VARIANTS = {"thumb": 128, "medium": 512}
+# w に指定された値はこの中で以上となる最小の値に切り上げ、生成する縮小画像の種類を限定する
+WIDTHS = [64, 128, 256, 512, 1024]
+
+# 展開後の画素数の上限(これを超える画像は展開せずにエラーとする)
+MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 50_000_000))
+QUALITY = {WEBP: 80, JPEG: 85}
+
+
+class InvalidImageError(Exception):
+    pass
+
+
+def supported() -> bool:
+    # Pillow は import に時間がかかるため、縮小画像の生成時まで読み込まない
+    return find_spec("PIL") is not None
+
+
+@lru_cache(maxsize=None)
+def load_pillow():
+    from PIL import Image, features
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    return (Image, features.check("webp"))
+
+
+def variant_width(variant: Optional[str], width: Optional[int]) -> Optional[int]:
+    if variant is not None:
+        return VARIANTS[variant]
+    if width is None:
+        return None
+    return next((x for x in WIDTHS if x >= width), WIDTHS[-1])
+
+
+def output_format(accept: str) -> str:
+    """Accept に image/webp が含まれ、Pillow が WebP に対応している場合は WebP"""
+    (_, webp) = load_pillow()
+    return WEBP if webp and MEDIA_TYPES[WEBP] in accept else JPEG
+
+
+def variant_key(key: str, width: int, format: str) -> str:
+    """縮小画像の保存先(元画像のキーに幅と形式を付与する)"""
+    return f"{key}.w{width}.{format}"
+
+
+def variant_prefix(key: str) -> str:
+    return f"{key}.w"
+
+
+def resize(data: bytes, width: int, format: str) -> bytes:
+    """長辺が width ピクセル以下になるよう縮小する
+
+    JPEG は draft により縮小に必要な解像度(1/2・1/4・1/8)で展開し、展開時のメモリを抑える。
+    アニメーションGIFは先頭のフレームのみを利用する。
+    """
+    (Image, _) = load_pillow()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # 展開前(ヘッダの読み込みのみの時点)で画素数を確認する
+            if image.width * image.height > MAX_PIXELS:
+                raise InvalidImageError(f"image is too large: {image.size}")
+            image.draft("RGB", (width, width))
+            image.thumbnail((width, width), Image.LANCZOS)
+            image = flatten(Image, image, format)
+            output = io.BytesIO()
+            image.save(output, format=format.upper(), quality=QUALITY[format])
+            return output.getvalue()
+    except (Image.DecompressionBombError, OSError, SyntaxError, ValueError) as e:
+        raise InvalidImageError(str(e)) from e
+
+
+def flatten(Image, image, format: str):
+    # JPEG は透過を扱えないため白背景に合成する
+    if image.mode in ["RGBA", "LA"] or (
+        image.mode == "P" and "transparency" in image.info
+    ):
+        image = image.convert("RGBA")
+        if format == WEBP:
+            return image
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB") if image.mode != "RGB" else image
@@ -0,0 +1,82 @@
+import asyncio
+import os
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List
+
+from pynamodb.connection import Connection
+from pynamodb.transactions import TransactWrite
+
+from app.client_config import connection_kwargs, instrument, s3_client
+from app.custom_logging import CustomLogger
+from app.models import repository
+from app.models.dog_model import DogModel
+from app.models.event_model import EventModel
+from app.models.event_stat_model import EventStatModel
+from app.models.owner_model import OwnerModel
+from app.models.task_model import TaskModel
+from app.models.unique_model import UniqueModel
+
+is_offline = os.environ.get("IS_OFFLINE")
+logger = CustomLogger.getApplicationLogger()
+
+TRANSACT_WRITE_MAX_ITEMS = 25
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_GET_MAX_ITEMS = 100
+
+MODELS = [DogModel, EventModel, EventStatModel, OwnerModel, TaskModel, UniqueModel]
+
+connection = Connection(**connection_kwargs())
+warmed_up = False
+
+
+@contextmanager
+def transact_write() -> Iterator[TransactWrite]:
+    # TransactWrite.__enter__ の型定義は Transaction を返却するため、TransactWrite として渡す
+    transaction = TransactWrite(connection=connection)
+    with transaction:
+        yield transaction
+
+
+def warm_up_tasks() -> List[Callable[[], Any]]:
+    """起動時に接続を確立しておく処理の一覧
+
+    各モデルと共有コネクションはそれぞれ botocore クライアント(接続プール)を持つため、
+    それぞれでテーブル定義を取得する。取得したテーブル定義は以降のリクエストでも再利用される。
+    """
+
+    def model_task(model_class) -> Callable[[], Any]:
+        def func() -> Any:
+            table = model_class._get_connection()
+            instrument(model_class.__name__, table.connection.client)
+            return table.get_meta_table()
+
+        return func
+
+    def connection_task() -> Any:
+        instrument("Connection", connection.client)
+        return [
+            connection.get_meta_table(x._get_connection().table_name) for x in MODELS
+        ]
+
+    tasks = [model_task(x) for x in MODELS] + [connection_task]
+    bucket = os.environ.get("IMAGE_BUCKET")
+    if bucket and not is_offline:
+        tasks.append(lambda: s3_client().head_bucket(Bucket=bucket))
+    return tasks
+
+
+async def warm_up() -> None:
+    """接続を確立する(プロセス内で1度だけ)
+
+    Mangum 0.10 は呼び出しごとに lifespan の startup を実行するため、実行済みであれば何もしない。
+    """
+    global warmed_up
+    if warmed_up:
+        return
+    warmed_up = True
+    results = await asyncio.gather(
+        *(repository.run(x) for x in warm_up_tasks()), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"failed to warm up connection: {result}")
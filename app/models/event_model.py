@@ -2,12 +2,13 @@ import os
 from datetime import datetime
 
 from pynamodb.attributes import UnicodeAttribute
-from pynamodb.indexes import AllProjection, LocalSecondaryIndex
+from pynamodb.indexes import AllProjection, GlobalSecondaryIndex, LocalSecondaryIndex
 from pynamodb.models import Model
 from pynamodb_attributes import IntegerAttribute
 
+from app.client_config import ModelMeta
+
 prefix = os.environ.get("TABLE_PREFIX")
-is_offline = os.environ.get("IS_OFFLINE")
 
 
 class TimestampIndex(LocalSecondaryIndex):
@@ -21,12 +22,31 @@ class TimestampIndex(LocalSecondaryIndex):
     timestamp = IntegerAttribute(range_key=True, null=False)
 
 
-class EventModel(Model):
+class DogTimestampIndex(GlobalSecondaryIndex):
+    class Meta:
+        index_name = "event-gsi1"
+        read_capacity_units = 2
+        write_capacity_units = 2
+        projection = AllProjection()
+
+    owner_id = UnicodeAttribute(hash_key=True, null=False)
+    dog_timestamp = UnicodeAttribute(range_key=True, null=False)
+
+
+class TaskTimestampIndex(GlobalSecondaryIndex):
     class Meta:
+        index_name = "event-gsi2"
+        read_capacity_units = 2
+        write_capacity_units = 2
+        projection = AllProjection()
+
+    owner_id = UnicodeAttribute(hash_key=True, null=False)
+    task_timestamp = UnicodeAttribute(range_key=True, null=False)
+
+
+class EventModel(Model):
+    class Meta(ModelMeta):
         table_name = f"{prefix}-event"
-        region = "ap-northeast-1"
-        if is_offline:
-            host = "http://localhost:8000"
 
     owner_id = UnicodeAttribute(hash_key=True, null=False)
     event_id = UnicodeAttribute(range_key=True, null=False)
@@ -34,6 +54,21 @@ class EventModel(Model):
     timestamp_index = TimestampIndex()
     task_id = UnicodeAttribute(null=False)
     dog_id = UnicodeAttribute(null=False)
+    # 犬ID・タスクIDごとに実施日時順で引くための "<ID>#<実施日時(10桁)>"
+    dog_timestamp = UnicodeAttribute(null=True)
+    dog_timestamp_index = DogTimestampIndex()
+    task_timestamp = UnicodeAttribute(null=True)
+    task_timestamp_index = TaskTimestampIndex()
     updated_at = IntegerAttribute(
         null=False, default=int(datetime.timestamp(datetime.now()))
     )
+    # ETag に使用する更新回数(登録時は0、更新のたびに1加算する)
+    version = IntegerAttribute(null=False, default=0)
+
+    @classmethod
+    def index_key(cls, id: str, timestamp: int) -> str:
+        return f"{id}#{timestamp:010d}"
+
+    def update_index_keys(self) -> None:
+        self.dog_timestamp = self.index_key(self.dog_id, self.timestamp)
+        self.task_timestamp = self.index_key(self.task_id, self.timestamp)
@@ -0,0 +1,39 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from pynamodb.attributes import UnicodeAttribute
+from pynamodb.models import Model
+from pynamodb_attributes import IntegerAttribute
+
+from app.client_config import ModelMeta
+
+prefix = os.environ.get("TABLE_PREFIX")
+
+JST = timezone(timedelta(hours=+9), "JST")
+
+
+class EventStatModel(Model):
+    """日・犬・タスク単位のイベント件数の集計アイテム
+
+    イベント情報の登録・更新・削除時に total(属性名 count)を ADD で増減させる。
+    (Model.count() と衝突しないよう、属性名と異なる名前で定義する)
+    週・月単位の集計は読み出し時に日単位のアイテムを合算して求める。
+    """
+
+    class Meta(ModelMeta):
+        table_name = f"{prefix}-event-stat"
+
+    owner_id = UnicodeAttribute(hash_key=True, null=False)
+    bucket = UnicodeAttribute(range_key=True, null=False)
+    day = IntegerAttribute(null=False)
+    dog_id = UnicodeAttribute(null=False)
+    task_id = UnicodeAttribute(null=False)
+    total = IntegerAttribute(attr_name="count", null=False, default=0)
+
+    @classmethod
+    def to_day(cls, timestamp: int) -> int:
+        return int(datetime.fromtimestamp(timestamp, JST).strftime("%Y%m%d"))
+
+    @classmethod
+    def day_bucket(cls, day: int, dog_id: str, task_id: str) -> str:
+        return f"day#{day}#{dog_id}#{task_id}"
@@ -2,22 +2,32 @@ import os
 from datetime import datetime
 
 from pynamodb.attributes import UnicodeAttribute
+from pynamodb.indexes import GlobalSecondaryIndex, KeysOnlyProjection
 from pynamodb.models import Model
 from pynamodb_attributes import IntegerAttribute
 
+from app.client_config import ModelMeta
+
 prefix = os.environ.get("TABLE_PREFIX")
-is_offline = os.environ.get("IS_OFFLINE")
 
 
-class OwnerModel(Model):
+class EmailIndex(GlobalSecondaryIndex):
     class Meta:
+        index_name = "owner-gsi1"
+        read_capacity_units = 2
+        write_capacity_units = 2
+        projection = KeysOnlyProjection()
+
+    email = UnicodeAttribute(hash_key=True, null=False)
+
+
+class OwnerModel(Model):
+    class Meta(ModelMeta):
         table_name = f"{prefix}-owner"
-        region = "ap-northeast-1"
-        if is_offline:
-            host = "http://localhost:8000"
 
     id = UnicodeAttribute(hash_key=True, null=False)
     email = UnicodeAttribute(null=False)
+    email_index = EmailIndex()
     created_at = IntegerAttribute(
         null=False, default=int(datetime.timestamp(datetime.now()))
     )
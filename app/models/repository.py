@@ -0,0 +1,47 @@
+"""モデルに対するデータアクセスの async def 向けラッパー
+
+PynamoDB・boto3 はブロッキングなクライアントのため、呼び出しをスレッドプール
+(run_in_threadpool)で実行して待ち合わせるだけで、asyncio ネイティブなI/Oではない。
+1リクエスト内の互いに独立した呼び出しを asyncio.gather で重ねられるが、
+同時に実行できる数はスレッドプールと接続プールの上限に従う。
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+from pynamodb.models import Model
+from pynamodb.pagination import ResultIterator
+from starlette.concurrency import run_in_threadpool
+
+T = TypeVar("T")
+M = TypeVar("M", bound=Model)
+
+
+async def run(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    return await run_in_threadpool(func, *args, **kwargs)
+
+
+async def get(
+    model_class: Type[M], hash_key: str, range_key: Optional[str] = None, **kwargs: Any
+) -> Optional[M]:
+    def func() -> Optional[M]:
+        try:
+            return model_class.get(hash_key=hash_key, range_key=range_key, **kwargs)
+        except model_class.DoesNotExist:
+            return None
+
+    return await run_in_threadpool(func)
+
+
+async def fetch(
+    query: Callable[[], ResultIterator]
+) -> Tuple[List[Any], Optional[Dict[str, Any]]]:
+    def func() -> Tuple[List[Any], Optional[Dict[str, Any]]]:
+        results = query()
+        items = [*results]
+        return (items, results.last_evaluated_key)
+
+    return await run_in_threadpool(func)
+
+
+async def query(model_class: Type[M], hash_key: str, **kwargs: Any) -> List[M]:
+    (items, _) = await fetch(lambda: model_class.query(hash_key=hash_key, **kwargs))
+    return items
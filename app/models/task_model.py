@@ -5,16 +5,14 @@ from pynamodb.attributes import BooleanAttribute, UnicodeAttribute
 from pynamodb.models import Model
 from pynamodb_attributes import IntegerAttribute
 
+from app.client_config import ModelMeta
+
 prefix = os.environ.get("TABLE_PREFIX")
-is_offline = os.environ.get("IS_OFFLINE")
 
 
 class TaskModel(Model):
-    class Meta:
+    class Meta(ModelMeta):
         table_name = f"{prefix}-task"
-        region = "ap-northeast-1"
-        if is_offline:
-            host = "http://localhost:8000"
 
     owner_id = UnicodeAttribute(hash_key=True, null=False)
     task_id = UnicodeAttribute(range_key=True, null=False)
@@ -25,3 +23,5 @@ class TaskModel(Model):
     updated_at = IntegerAttribute(
         null=False, default=int(datetime.timestamp(datetime.now()))
     )
+    # ETag に使用する更新回数(登録時は0、更新のたびに1加算する)
+    version = IntegerAttribute(null=False, default=0)
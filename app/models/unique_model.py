@@ -0,0 +1,34 @@
+import os
+from datetime import datetime
+
+from pynamodb.attributes import UnicodeAttribute
+from pynamodb.models import Model
+from pynamodb_attributes import IntegerAttribute
+
+from app.client_config import ModelMeta
+
+prefix = os.environ.get("TABLE_PREFIX")
+
+
+class UniqueModel(Model):
+    """一意制約を表す番兵アイテム
+
+    エンティティと同じトランザクションで条件付き書き込みを行い、
+    オーナー内での名前等の重複を防ぐ。
+    """
+
+    class Meta(ModelMeta):
+        table_name = f"{prefix}-unique"
+
+    id = UnicodeAttribute(hash_key=True, null=False)
+    created_at = IntegerAttribute(
+        null=False, default=int(datetime.timestamp(datetime.now()))
+    )
+
+    @classmethod
+    def dog_name(cls, owner_id: str, name: str) -> "UniqueModel":
+        return cls(id=f"dog-name#{owner_id}#{name}")
+
+    @classmethod
+    def task_title(cls, owner_id: str, title: str) -> "UniqueModel":
+        return cls(id=f"task-title#{owner_id}#{title}")
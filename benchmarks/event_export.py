@@ -0,0 +1,99 @@
+"""イベント情報の全件取得にかかる転送量と時間の計測
+
+ローカルのDynamoDBに対して実行する。
+
+    python benchmarks/event_export.py [イベント件数] [犬の件数]
+
+json   : 一覧取得APIを limit=1000 でページングして全件取得
+csv.gz : エクスポートAPI (gzip圧縮したCSV)
+arrow  : エクスポートAPI (辞書エンコード + zstd圧縮のArrow、pyarrowがある場合のみ)
+
+転送量は Accept-Encoding: gzip を指定した場合の、レスポンス本文の圧縮されたままのバイト数。
+"""
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from fastapi.testclient import TestClient
+from requests.models import Response
+
+from app.api.main import app
+from app.export import supported_formats
+from app.models.event_model import EventModel
+from app.models.owner_model import OwnerModel
+
+OWNER_ID = "b2000000000000000000000000000000"
+HEADERS = {"x-api-key": "bench", "Accept-Encoding": "gzip"}
+
+
+def seed(event_count: int, dog_count: int) -> None:
+    for model in EventModel.query(hash_key=OWNER_ID):
+        model.delete()
+    with EventModel.batch_write() as batch:
+        for i in range(event_count):
+            batch.save(
+                EventModel(
+                    owner_id=OWNER_ID,
+                    event_id=f"{i:032x}",
+                    timestamp=1600000000 + i * 60,
+                    dog_id=f"{i % dog_count:032d}",
+                    task_id=f"{i % 7:032x}",
+                )
+            )
+
+
+def wire_bytes(response: Response) -> int:
+    # TestClient が展開する前の(Content-Encoding が適用された)本文の大きさ
+    return len(response.raw.read(decode_content=False))
+
+
+def measure(func: Callable[[], int]) -> Tuple[int, float]:
+    start = time.perf_counter()
+    size = func()
+    return (size, (time.perf_counter() - start) * 1000)
+
+
+def main() -> None:
+    event_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    dog_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    os.environ["LOG_LEVEL"] = "WARNING"
+    OwnerModel(id=OWNER_ID, email="bench-export@test.com").save()
+    seed(event_count, dog_count)
+    client = TestClient(app)
+    url = f"/owners/{OWNER_ID}/events/"
+
+    def json_pages() -> int:
+        size = 0
+        params: Dict[str, Any] = {"from": 0, "to": 9999999999, "limit": 1000}
+        while True:
+            response = client.get(url, headers=HEADERS, params=params, stream=True)
+            size += wire_bytes(response)
+            if "x-next-cursor" not in response.headers:
+                return size
+            params["cursor"] = response.headers["x-next-cursor"]
+
+    def export(format: str) -> Callable[[], int]:
+        def func() -> int:
+            params = {"format": format}
+            response = client.get(
+                f"{url}export", headers=HEADERS, params=params, stream=True
+            )
+            return wire_bytes(response)
+
+        return func
+
+    rows = [("json (paged)", measure(json_pages))]
+    for format in supported_formats():
+        rows.append((format, measure(export(format))))
+
+    print(f"events={event_count} dogs={dog_count}")
+    for (label, (size, elapsed)) in rows:
+        print(f"{label:<16} bytes={size:>10} time={elapsed:8.1f}ms")
+
+    seed(0, dog_count)
+    OwnerModel(id=OWNER_ID).delete()
+
+
+if __name__ == "__main__":
+    main()
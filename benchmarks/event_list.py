@@ -0,0 +1,144 @@
+"""イベント情報一覧取得の振り分け処理と取得処理の計測
+
+    python benchmarks/event_list.py [犬の件数] [イベント件数] [試行回数] [登録イベント件数]
+
+grouping: 犬ごとの振り分け処理のみをメモリ上で計測する (DynamoDB不要)
+    before: 犬ごとに filter + sorted で振り分ける旧実装 (O(犬 × イベント))
+    after : dog_id をキーにした dict へ1回の走査で振り分ける現実装 (event_controller.group_by_dog)
+fetch   : ローカルのDynamoDBに登録イベント件数を登録し、一覧取得全体を計測する
+    before: イベント情報と犬情報を順に取得
+    after : 犬情報とイベント情報の取得をスレッドプール上で重ねる現実装 (repository.run)
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+from app.api.controllers.event_controller import group_by_dog
+from app.models import repository
+from app.models.dog_model import DogModel
+from app.models.event_model import EventModel
+from app.models.owner_model import OwnerModel
+
+OWNER_ID = "b1000000000000000000000000000000"
+TASK_ID = "c1000000000000000000000000000000"
+
+
+def create_models(dog_count: int, event_count: int):
+    dogs = [
+        DogModel(
+            owner_id=OWNER_ID,
+            dog_id=f"{i:032d}",
+            name=f"dog-{i}",
+            order=dog_count - i,
+        )
+        for i in range(dog_count)
+    ]
+    events = [
+        EventModel(
+            owner_id=OWNER_ID,
+            event_id=f"{i:032x}",
+            timestamp=i,
+            task_id=TASK_ID,
+            dog_id=random.choice(dogs).dog_id,
+        )
+        for i in range(event_count)
+    ]
+    return (sorted(dogs, key=lambda x: x.order), events)
+
+
+def legacy_grouping(dogs: List[DogModel], events: List[EventModel]) -> List[EventModel]:
+    results: List[EventModel] = []
+    for dog in dogs:
+        items = filter(lambda x: x.dog_id == dog.dog_id, events)
+        results.extend(sorted(items, key=lambda x: x.timestamp))
+    return results
+
+
+def measure(trials: int, func: Callable[[], object]) -> List[float]:
+    results = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        func()
+        results.append((time.perf_counter() - start) * 1000)
+    return results
+
+
+def seed(dogs: List[DogModel], events: List[EventModel]) -> None:
+    for event in EventModel.query(hash_key=OWNER_ID):
+        event.delete()
+    for dog in DogModel.query(hash_key=OWNER_ID):
+        dog.delete()
+    with DogModel.batch_write() as dog_batch:
+        for dog in dogs:
+            dog_batch.save(dog)
+    with EventModel.batch_write() as event_batch:
+        for event in events:
+            event_batch.save(event)
+
+
+def report(label: str, results: List[float]) -> None:
+    print(
+        f"{label:<32} median={statistics.median(results):8.1f}ms"
+        f" max={max(results):8.1f}ms"
+    )
+
+
+def main() -> None:
+    dog_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    event_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    trials = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    seed_count = int(sys.argv[4]) if len(sys.argv) > 4 else 2000
+    os.environ["LOG_LEVEL"] = "WARNING"
+
+    (dogs, events) = create_models(dog_count, event_count)
+    assert legacy_grouping(dogs, events) == group_by_dog(dogs, events)
+    print(f"grouping: dogs={dog_count} events={event_count} trials={trials}")
+    report(
+        "before: filter per dog", measure(trials, lambda: legacy_grouping(dogs, events))
+    )
+    report(
+        "after : dict in one pass",
+        measure(trials, lambda: group_by_dog(dogs, events)),
+    )
+
+    OwnerModel(id=OWNER_ID, email="bench-event@test.com").save()
+    seed(dogs, events[:seed_count])
+
+    def query_events() -> List[EventModel]:
+        return [
+            *EventModel.timestamp_index.query(
+                hash_key=OWNER_ID,
+                range_key_condition=EventModel.timestamp.between(0, seed_count),
+            )
+        ]
+
+    def query_dogs() -> List[DogModel]:
+        return [*DogModel.query(hash_key=OWNER_ID)]
+
+    def sequential_fetch() -> None:
+        fetched = query_events()
+        group_by_dog(sorted(query_dogs(), key=lambda x: x.order), fetched)
+
+    async def gather_queries():
+        return await asyncio.gather(
+            repository.run(query_events), repository.run(query_dogs)
+        )
+
+    def current_fetch() -> None:
+        (fetched, fetched_dogs) = asyncio.run(gather_queries())
+        group_by_dog(sorted(fetched_dogs, key=lambda x: x.order), fetched)
+
+    print(f"fetch: dogs={dog_count} events={seed_count} trials={trials}")
+    report("before: sequential queries", measure(trials, sequential_fetch))
+    report("after : queries in threadpool", measure(trials, current_fetch))
+
+    seed([], [])
+    OwnerModel(id=OWNER_ID).delete()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""縮小画像の生成時間と転送量の計測 (Pillowが必要、S3不要)
+
+    python benchmarks/image_variant.py [元画像の幅] [元画像の高さ] [試行回数]
+
+スマートフォンのカメラ画像相当のJPEGを生成し、縮小画像の種類・形式ごとに
+生成時間の中央値と、元画像に対するバイト数を出力する。
+draft 無しの行は、元の解像度のまま展開してから縮小した場合(JPEGの縮小展開を行わない場合)の比較用。
+"""
+import io
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+from app import image
+
+
+def create_photo(width: int, height: int) -> bytes:
+    (Image, _) = image.load_pillow()
+    # 単色だと圧縮率が実際の写真と大きく異なるため、粗さの異なるノイズとグラデーションを重ねる
+    noise = Image.blend(
+        Image.effect_noise((width, height), 32).convert("RGB"),
+        Image.effect_noise((width // 32, height // 32), 96)
+        .resize((width, height), Image.BICUBIC)
+        .convert("RGB"),
+        0.7,
+    )
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    photo = Image.blend(noise, gradient, 0.5)
+    output = io.BytesIO()
+    photo.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def resize_without_draft(data: bytes, width: int, format: str) -> bytes:
+    (Image, _) = image.load_pillow()
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        resized = source.resize(
+            (width, width * source.height // source.width), Image.LANCZOS
+        )
+        output = io.BytesIO()
+        resized.save(output, format=format.upper(), quality=image.QUALITY[format])
+        return output.getvalue()
+
+
+def measure(trials: int, func: Callable[[], bytes]) -> List[float]:
+    results = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        func()
+        results.append((time.perf_counter() - start) * 1000)
+    return results
+
+
+def main() -> None:
+    if not image.supported():
+        print("Pillow is not installed.")
+        return
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 4032
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 3024
+    trials = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    original = create_photo(width, height)
+    print(f"original: {width}x{height} jpeg {len(original):,} bytes trials={trials}")
+    (_, webp) = image.load_pillow()
+    formats = [image.WEBP, image.JPEG] if webp else [image.JPEG]
+    for (variant, size) in image.VARIANTS.items():
+        for format in formats:
+            data = image.resize(original, size, format)
+            results = measure(trials, lambda: image.resize(original, size, format))
+            print(
+                f"{variant:<6} {format:<4} median={statistics.median(results):8.1f}ms"
+                f" bytes={len(data):>9,} ({len(data) / len(original):6.2%} of original)"
+            )
+        results = measure(
+            trials, lambda: resize_without_draft(original, size, image.JPEG)
+        )
+        print(
+            f"{variant:<6} jpeg without draft median={statistics.median(results):8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""コールドスタート時の import 時間の計測
+
+`python -X importtime` でアプリケーション(app.api.main)の import を別プロセスで繰り返し計測し、
+中央値が予算を超えた場合、または初回利用まで遅延させているモジュールが読み込まれた場合に
+終了コード 1 で終了する。
+
+    python benchmarks/import_time.py [予算(ms)] [試行回数]
+
+予算は環境変数 IMPORT_TIME_BUDGET_MS でも指定できる。
+"""
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+TARGET = "app.api.main"
+DEFAULT_BUDGET_MS = 850
+
+# 初回の利用時に読み込むモジュール(起動時に import されてはならない)
+DEFERRED_MODULES = ["boto3", "pyarrow", "PIL"]
+
+
+def import_times() -> Dict[str, Tuple[int, int]]:
+    """モジュールごとの (自身の時間, 累積時間) をマイクロ秒で返却する"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {TARGET}"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    times: Dict[str, Tuple[int, int]] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        (self_us, cumulative_us, name) = line.partition(":")[2].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main() -> int:
+    budget_ms = float(
+        sys.argv[1]
+        if len(sys.argv) > 1
+        else os.environ.get("IMPORT_TIME_BUDGET_MS", str(DEFAULT_BUDGET_MS))
+    )
+    trials = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    # 1回目は .pyc の生成を含むため計測から除く
+    times = import_times()
+    results: List[float] = []
+    for _ in range(trials):
+        times = import_times()
+        results.append(times[TARGET][1] / 1000)
+
+    print(f"import {TARGET}: trials={trials} budget={budget_ms:.0f}ms")
+    print(f"median={statistics.median(results):8.1f}ms max={max(results):8.1f}ms")
+    print("slowest modules (cumulative):")
+    for (name, (_, cumulative_us)) in sorted(
+        times.items(), key=lambda x: x[1][1], reverse=True
+    )[1:11]:
+        print(f"  {cumulative_us / 1000:8.1f}ms {name}")
+
+    failed = False
+    loaded = [x for x in DEFERRED_MODULES if x in times]
+    if loaded:
+        print(f"NG: deferred modules are imported at startup: {', '.join(loaded)}")
+        failed = True
+    if statistics.median(results) > budget_ms:
+        print(f"NG: import time exceeds the budget ({budget_ms:.0f}ms)")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""表示順に欠番がある状態での犬情報一覧取得のレイテンシ計測
+
+ローカルのDynamoDBに対して実行する。
+
+    python benchmarks/list_order.py [件数] [試行回数]
+
+before: 一覧取得時に欠番を1件ずつ save() で詰める旧実装
+after : 一覧取得は読み取りのみ、欠番は削除時にトランザクションでまとめて詰める現実装
+"""
+import os
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+from fastapi.testclient import TestClient
+
+from app.api.controllers.common import compact_orders
+from app.api.main import app
+from app.models.dog_model import DogModel
+from app.models.owner_model import OwnerModel
+
+OWNER_ID = "b0000000000000000000000000000000"
+
+
+def seed(count: int) -> None:
+    for model in DogModel.query(hash_key=OWNER_ID):
+        model.delete()
+    with DogModel.batch_write() as batch:
+        for i in range(count):
+            batch.save(
+                DogModel(
+                    owner_id=OWNER_ID,
+                    dog_id=f"{i:032d}",
+                    name=f"dog-{i}",
+                    order=(i + 1) * 2,
+                )
+            )
+
+
+def legacy_list() -> None:
+    dogs = [x for x in DogModel.query(hash_key=OWNER_ID)]
+    dogs.sort(key=lambda x: x.order)
+    for (idx, dog) in enumerate(dogs):
+        if idx + 1 == dog.order:
+            continue
+        dog.order = idx + 1
+        dog.save()
+
+
+def measure(count: int, trials: int, func: Callable[[], None]) -> List[float]:
+    results = []
+    for _ in range(trials):
+        seed(count)
+        start = time.perf_counter()
+        func()
+        results.append((time.perf_counter() - start) * 1000)
+    return results
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    trials = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    os.environ["LOG_LEVEL"] = "WARNING"
+    OwnerModel(id=OWNER_ID, email="bench@test.com").save()
+
+    client = TestClient(app)
+    headers = {"x-api-key": "bench"}
+
+    def current_list() -> None:
+        client.get(f"/owners/{OWNER_ID}/dogs/", headers=headers)
+
+    def current_compaction() -> None:
+        compact_orders(DogModel, DogModel.dog_id, OWNER_ID)
+
+    rows = [
+        ("before: GET (save per gap)", measure(count, trials, legacy_list)),
+        ("after : GET (read only)", measure(count, trials, current_list)),
+        ("after : compaction on delete", measure(count, trials, current_compaction)),
+    ]
+    print(f"dogs={count} trials={trials}")
+    for (label, results) in rows:
+        print(
+            f"{label:<32} median={statistics.median(results):8.1f}ms"
+            f" max={max(results):8.1f}ms"
+        )
+
+    seed(0)
+    OwnerModel(id=OWNER_ID).delete()
+
+
+if __name__ == "__main__":
+    main()
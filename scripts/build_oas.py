@@ -0,0 +1,38 @@
+"""ルート定義から OpenAPI ドキュメント(oas/bow.json)を生成する
+
+    python scripts/build_oas.py          # oas/bow.json を再生成する
+    python scripts/build_oas.py --check  # oas/bow.json がルート定義と異なる場合は終了コード 1
+"""
+import argparse
+import sys
+
+from app.api.main import app
+from app.api.openapi import OAS_PATH, dumps, generate
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="oas/bow.json を更新せず、差分の有無のみ確認する",
+    )
+    args = parser.parse_args()
+
+    document = dumps(generate(app))
+    current = OAS_PATH.read_text(encoding="utf-8") if OAS_PATH.exists() else None
+    if document == current:
+        print(f"{OAS_PATH.name} is up to date.")
+        return 0
+
+    if args.check:
+        print(f"{OAS_PATH.name} is out of date. run: python scripts/build_oas.py")
+        return 1
+
+    OAS_PATH.write_text(document, encoding="utf-8")
+    print(f"{OAS_PATH.name} is updated.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""イベントテーブルのGSI(event-gsi1, event-gsi2)のキーを既存アイテムへ書き込む
+
+GSI自体は resource/event-indexes.yml の手順に従いデプロイで作成する。
+GSIのキーとなる dog_timestamp / task_timestamp は既存アイテムには存在しないため、
+未設定のアイテムに値を書き込む(書き込んだアイテムから順にGSIへ反映される)。
+
+    python scripts/migrate_event_indexes.py
+"""
+import sys
+
+from pynamodb.exceptions import UpdateError
+
+from app.api.controllers.common import version_condition
+from app.models.event_model import EventModel
+
+
+def backfill() -> int:
+    count = 0
+    for model in EventModel.scan():
+        keys = (model.dog_timestamp, model.task_timestamp)
+        model.update_index_keys()
+        if keys == (model.dog_timestamp, model.task_timestamp):
+            continue
+        try:
+            model.update(
+                actions=[
+                    EventModel.dog_timestamp.set(model.dog_timestamp),
+                    EventModel.task_timestamp.set(model.task_timestamp),
+                ],
+                condition=version_condition(EventModel, model.version),
+            )
+        except UpdateError as e:
+            # 移行中にAPIから更新されたアイテムは、索引キーも書き込まれている
+            print(f"event [{model.owner_id}/{model.event_id}] is skipped: {e}")
+            continue
+        count += 1
+    print(f"{count} events are backfilled.")
+    return 0
+
+
+def main() -> int:
+    return backfill()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
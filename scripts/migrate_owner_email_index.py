@@ -0,0 +1,93 @@
+"""オーナーテーブルへメールアドレスのGSI(owner-gsi1)を追加し、既存データを検証する
+
+GSIの作成後はDynamoDB側で既存アイテムのバックフィルが行われるため、
+本スクリプトではインデックスがACTIVEになるまで待機した上で、
+インデックスから引けないオーナー(email未設定)と重複したメールアドレスを報告する。
+
+    python scripts/migrate_owner_email_index.py
+"""
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import boto3
+
+from app.models.owner_model import OwnerModel
+
+INDEX_NAME = OwnerModel.email_index.Meta.index_name
+
+
+def create_client():
+    meta = OwnerModel.Meta
+    return boto3.client(
+        "dynamodb", region_name=meta.region, endpoint_url=getattr(meta, "host", None)
+    )
+
+
+def create_index(client) -> None:
+    table = client.describe_table(TableName=OwnerModel.Meta.table_name)["Table"]
+    indexes = [x["IndexName"] for x in table.get("GlobalSecondaryIndexes", [])]
+    if INDEX_NAME in indexes:
+        print(f"index [{INDEX_NAME}] is already exists.")
+        return
+
+    index: Dict = {
+        "IndexName": INDEX_NAME,
+        "KeySchema": [{"AttributeName": "email", "KeyType": "HASH"}],
+        "Projection": {"ProjectionType": "KEYS_ONLY"},
+    }
+    billing_mode = table.get("BillingModeSummary", {}).get("BillingMode")
+    if billing_mode != "PAY_PER_REQUEST":
+        index["ProvisionedThroughput"] = {
+            "ReadCapacityUnits": OwnerModel.email_index.Meta.read_capacity_units,
+            "WriteCapacityUnits": OwnerModel.email_index.Meta.write_capacity_units,
+        }
+
+    client.update_table(
+        TableName=OwnerModel.Meta.table_name,
+        AttributeDefinitions=[{"AttributeName": "email", "AttributeType": "S"}],
+        GlobalSecondaryIndexUpdates=[{"Create": index}],
+    )
+    print(f"index [{INDEX_NAME}] is creating.")
+
+
+def wait_for_index(client) -> None:
+    while True:
+        table = client.describe_table(TableName=OwnerModel.Meta.table_name)["Table"]
+        for index in table.get("GlobalSecondaryIndexes", []):
+            if index["IndexName"] == INDEX_NAME and index["IndexStatus"] == "ACTIVE":
+                if not index.get("Backfilling", False):
+                    print(f"index [{INDEX_NAME}] is active.")
+                    return
+        time.sleep(5)
+
+
+def verify() -> int:
+    owners: Dict[str, List[str]] = defaultdict(list)
+    missing: List[str] = []
+    for model in OwnerModel.scan():
+        if not model.email:
+            missing.append(model.id)
+            continue
+        owners[model.email].append(model.id)
+
+    for owner_id in missing:
+        print(f"owner [{owner_id}] has no email.")
+    duplicates = {k: v for (k, v) in owners.items() if len(v) > 1}
+    for (email, owner_ids) in duplicates.items():
+        print(f"email [{email}] is duplicated: {', '.join(owner_ids)}")
+
+    print(f"{sum(len(x) for x in owners.values())} owners are indexed.")
+    return 1 if missing or duplicates else 0
+
+
+def main() -> int:
+    client = create_client()
+    create_index(client)
+    wait_for_index(client)
+    return verify()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""既存の犬情報・タスク情報に対して一意制約の番兵アイテムを作成する
+
+    python scripts/migrate_unique_names.py
+
+オーナー内で犬の名前・タスクのタイトルが重複している場合は報告のみ行う。
+"""
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+from app.models.dog_model import DogModel
+from app.models.task_model import TaskModel
+from app.models.unique_model import UniqueModel
+
+
+def main() -> int:
+    entities: Dict[str, List[str]] = defaultdict(list)
+    for dog in DogModel.scan():
+        entities[UniqueModel.dog_name(dog.owner_id, dog.name).id].append(dog.dog_id)
+    for task in TaskModel.scan():
+        key = UniqueModel.task_title(task.owner_id, task.title).id
+        entities[key].append(task.task_id)
+
+    with UniqueModel.batch_write() as batch:
+        for key in entities.keys():
+            batch.save(UniqueModel(id=key))
+
+    duplicates = {k: v for (k, v) in entities.items() if len(v) > 1}
+    for (key, ids) in duplicates.items():
+        print(f"[{key}] is duplicated: {', '.join(ids)}")
+
+    print(f"{len(entities)} unique items are written.")
+    return 1 if duplicates else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
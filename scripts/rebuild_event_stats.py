@@ -0,0 +1,65 @@
+"""イベント情報からイベント件数の集計アイテムを作り直す
+
+    python scripts/rebuild_event_stats.py [オーナーID ...]
+
+オーナーIDを省略した場合は全イベント情報を走査する。
+対象オーナーの既存の集計アイテムは削除してから書き込む。
+"""
+import sys
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from app.models.event_model import EventModel
+from app.models.event_stat_model import EventStatModel
+
+
+def main(owner_ids: List[str]) -> int:
+    events: Iterable[EventModel]
+    if owner_ids:
+        events = (x for owner_id in owner_ids for x in EventModel.query(owner_id))
+    else:
+        events = EventModel.scan()
+
+    counts: Dict[str, Counter] = defaultdict(Counter)
+    for event in events:
+        key: Tuple[int, str, str] = (
+            EventStatModel.to_day(event.timestamp),
+            event.dog_id,
+            event.task_id,
+        )
+        counts[event.owner_id][key] += 1
+
+    # イベント情報が残っていないオーナーの集計アイテムも削除対象にする
+    if owner_ids:
+        stat_owner_ids = owner_ids
+    else:
+        stats = EventStatModel.scan(attributes_to_get=["owner_id", "bucket"])
+        stat_owner_ids = [x.owner_id for x in stats]
+    for owner_id in stat_owner_ids:
+        counts.setdefault(owner_id, Counter())
+
+    for (owner_id, owner_counts) in counts.items():
+        with EventStatModel.batch_write() as batch:
+            for model in EventStatModel.query(
+                owner_id, attributes_to_get=["owner_id", "bucket"]
+            ):
+                batch.delete(model)
+        with EventStatModel.batch_write() as batch:
+            for ((day, dog_id, task_id), count) in owner_counts.items():
+                batch.save(
+                    EventStatModel(
+                        owner_id,
+                        EventStatModel.day_bucket(day, dog_id, task_id),
+                        day=day,
+                        dog_id=dog_id,
+                        task_id=task_id,
+                        total=count,
+                    )
+                )
+        print(f"[{owner_id}] {len(owner_counts)} stat items are written.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,12 +1,18 @@
 import os
+from contextlib import contextmanager
 from datetime import datetime
 
+import pytest
 from fastapi.testclient import TestClient
+from pynamodb.exceptions import TransactWriteError
 from requests.models import Response
 
+from app.api.controllers import common
 from app.api.main import app
 from app.models.dog_model import DogModel
+from app.models.event_model import EventModel
 from app.models.owner_model import OwnerModel
+from app.models.unique_model import UniqueModel
 
 OWNER_ID_1 = "00000000000000000000000000000000"
 OWNER_ID_2 = "22222222222222222222222222222222"
@@ -14,6 +20,7 @@ OWNER_ID_3 = "33333333333333333333333333333333"
 DOG_ID_MIN = "44444444444444444444444444444444"
 DOG_ID_MAX = "55555555555555555555555555555555"
 DOG_ID_NOT_EXIST = "66666666666666666666666666666666"
+DOG_ID_GAP = "77777777777777777777777777777777"
 UPDATED_AT = int(datetime.timestamp(datetime.now()))
 
 
@@ -59,9 +66,27 @@ class TestDogCongroller:
         )
         max_model.save()
 
+        # 表示順に欠番があるレコードは各テストで作成する
+        for gap_model in DogModel.query(
+            hash_key=OWNER_ID_1, range_key_condition=DogModel.dog_id == DOG_ID_GAP
+        ):
+            gap_model.delete()
+
     def get(self, url: str) -> Response:
         return self.client.get(url, headers=self.headers)
 
+    def post(self, url: str, json: dict) -> Response:
+        return self.client.post(url, headers=self.headers, json=json)
+
+    def put(self, url: str, json: dict) -> Response:
+        return self.client.put(url, headers=self.headers, json=json)
+
+    def patch(self, url: str, json: dict, headers: dict = {}) -> Response:
+        return self.client.patch(url, headers={**self.headers, **headers}, json=json)
+
+    def delete(self, url: str) -> Response:
+        return self.client.delete(url, headers=self.headers)
+
     def test_list_01(self):
         """
         犬情報の一覧取得
@@ -111,6 +136,63 @@ class TestDogCongroller:
         assert response.status_code == 404
         assert body == {"detail": "owner not found."}
 
+    def test_list_04(self):
+        """
+        犬情報の一覧取得
+        表示順に欠番がある場合、表示順で並べ替えられ、データは更新されないこと
+        """
+        gap_model = self.__create_model_min(
+            owner_id=OWNER_ID_1, dog_id=DOG_ID_GAP, updated_at=UPDATED_AT
+        )
+        gap_model.order = 5
+        gap_model.save()
+
+        response = self.get(f"/owners/{OWNER_ID_1}/dogs/")
+        body = response.json()
+        assert response.status_code == 200
+        assert [x["id"] for x in body] == [DOG_ID_MIN, DOG_ID_MAX, DOG_ID_GAP]
+        assert body[2]["order"] == 5
+
+        model = DogModel.get(hash_key=OWNER_ID_1, range_key=DOG_ID_GAP)
+        assert model.order == 5
+        assert model.updated_at == UPDATED_AT
+
+    def test_list_05(self):
+        """
+        犬情報の一覧取得
+        limitを指定した場合、cursorで続きが取得できること
+        """
+        response = self.get(f"/owners/{OWNER_ID_1}/dogs/?limit=1")
+        assert response.status_code == 200
+        assert [x["id"] for x in response.json()] == [DOG_ID_MIN]
+
+        cursor = response.headers["x-next-cursor"]
+        response = self.get(f"/owners/{OWNER_ID_1}/dogs/?limit=1&cursor={cursor}")
+        assert response.status_code == 200
+        assert [x["id"] for x in response.json()] == [DOG_ID_MAX]
+
+    def test_list_06(self):
+        """
+        犬情報の一覧取得
+        fieldsを指定した場合、指定した項目のみ取得できること
+        """
+        response = self.get(f"/owners/{OWNER_ID_1}/dogs/?fields=id,name")
+        body = response.json()
+        assert response.status_code == 200
+        assert body == [
+            {"id": DOG_ID_MIN, "name": f"{DOG_ID_MIN}-name"},
+            {"id": DOG_ID_MAX, "name": f"{DOG_ID_MAX}-name"},
+        ]
+
+    def test_list_07(self):
+        """
+        犬情報の一覧取得
+        存在しない項目をfieldsに指定した場合、400が返却されること
+        """
+        response = self.get(f"/owners/{OWNER_ID_1}/dogs/?fields=id,hoge")
+        assert response.status_code == 400
+        assert response.json() == {"detail": "illegal fields."}
+
     def test_get_01(self):
         """
         犬情報の1件取得
@@ -148,6 +230,325 @@ class TestDogCongroller:
         assert response.status_code == 404
         assert body == {"detail": "owner not found."}
 
+    def test_get_04(self):
+        """
+        犬情報の1件取得
+        fieldsを指定した場合、指定した項目のみ取得できること
+        """
+        response = self.get(
+            f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MAX}?fields=order,birth"
+        )
+        assert response.status_code == 200
+        assert response.json() == {"order": 1, "birth": 1111111111}
+
+    def test_get_05(self):
+        """
+        犬情報の1件取得
+        If-None-MatchにETagを指定した場合、304が返却されること
+        """
+        response = self.get(f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MIN}")
+        etag = response.headers["etag"]
+        assert etag == 'W/"0"'
+
+        response = self.client.get(
+            f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MIN}",
+            headers={**self.headers, "If-None-Match": etag},
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    def test_list_08(self):
+        """
+        犬情報の一覧取得
+        一覧が変更された場合、If-None-Matchに以前のETagを指定しても200が返却されること
+        """
+        response = self.get(f"/owners/{OWNER_ID_1}/dogs/")
+        etag = response.headers["etag"]
+        ids = [x["id"] for x in response.json()]
+        headers = {**self.headers, "If-None-Match": etag}
+
+        response = self.client.get(f"/owners/{OWNER_ID_1}/dogs/", headers=headers)
+        assert response.status_code == 304
+
+        self.put(f"/owners/{OWNER_ID_1}/dogs/order", json={"ids": ids[::-1]})
+        response = self.client.get(f"/owners/{OWNER_ID_1}/dogs/", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    def test_post_01(self):
+        """
+        犬情報の登録
+        新しい名前の場合、登録できること
+        """
+        response = self.post(
+            f"/owners/{OWNER_ID_2}/dogs/", json={"name": "new-dog", "order": 1}
+        )
+        body = response.json()
+        assert response.status_code == 201
+        assert body["name"] == "new-dog"
+
+        self.delete(f"/owners/{OWNER_ID_2}/dogs/{body['id']}")
+
+    def test_post_02(self):
+        """
+        犬情報の登録
+        既に登録されている名前の場合、400が返却されること
+        """
+        response = self.post(
+            f"/owners/{OWNER_ID_2}/dogs/", json={"name": "new-dog", "order": 1}
+        )
+        dog_id = response.json()["id"]
+
+        response = self.post(
+            f"/owners/{OWNER_ID_2}/dogs/", json={"name": "new-dog", "order": 2}
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "name is already exists."}
+        assert len([x for x in DogModel.query(hash_key=OWNER_ID_2)]) == 1
+
+        self.delete(f"/owners/{OWNER_ID_2}/dogs/{dog_id}")
+
+    def test_put_order_01(self):
+        """
+        犬情報の表示順の一括更新
+        指定したIDの並び順で表示順が更新されること
+        """
+        response = self.put(
+            f"/owners/{OWNER_ID_1}/dogs/order", json={"ids": [DOG_ID_MAX, DOG_ID_MIN]}
+        )
+        assert response.status_code == 200
+        assert response.json() == {}
+
+        models = {x.dog_id: x for x in DogModel.query(hash_key=OWNER_ID_1)}
+        assert models[DOG_ID_MAX].order == 1
+        assert models[DOG_ID_MIN].order == 2
+        assert models[DOG_ID_MIN].name == f"{DOG_ID_MIN}-name"
+
+    def test_put_order_02(self):
+        """
+        犬情報の表示順の一括更新
+        存在しないIDが含まれる場合、400が返却され、データが作成されないこと
+        """
+        response = self.put(
+            f"/owners/{OWNER_ID_1}/dogs/order",
+            json={"ids": [DOG_ID_MAX, DOG_ID_NOT_EXIST]},
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "illegal dog id."}
+
+        ids = [x.dog_id for x in DogModel.query(hash_key=OWNER_ID_1)]
+        assert DOG_ID_NOT_EXIST not in ids
+
+    def test_put_order_03(self):
+        """
+        犬情報の表示順の一括更新
+        IDが重複している場合、400が返却されること
+        """
+        response = self.put(
+            f"/owners/{OWNER_ID_1}/dogs/order", json={"ids": [DOG_ID_MAX, DOG_ID_MAX]}
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "ids are duplicated."}
+
+    def test_put_order_04(self):
+        """
+        犬情報の表示順の一括更新
+        オーナーに紐付く犬情報のIDが不足している場合、400が返却され、表示順が更新されないこと
+        """
+        orders = {x.dog_id: x.order for x in DogModel.query(hash_key=OWNER_ID_1)}
+
+        response = self.put(
+            f"/owners/{OWNER_ID_1}/dogs/order", json={"ids": [DOG_ID_MIN]}
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "all dog ids are required."}
+
+        assert {
+            x.dog_id: x.order for x in DogModel.query(hash_key=OWNER_ID_1)
+        } == orders
+
+    def test_patch_01(self):
+        """
+        犬情報の部分更新
+        指定した項目のみ更新され、更新後の情報が返却されること
+        """
+        response = self.patch(
+            f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MAX}", json={"color": 2, "birth": None}
+        )
+        body = response.json()
+        assert response.status_code == 200
+        assert body["color"] == 2
+        assert "birth" not in body
+        assert body["name"] == f"{DOG_ID_MAX}-name"
+        assert response.headers["etag"] == 'W/"1"'
+
+        model = DogModel.get(hash_key=OWNER_ID_1, range_key=DOG_ID_MAX)
+        assert model.color == 2
+        assert model.birth is None
+        assert model.gender == 1
+
+    def test_patch_02(self):
+        """
+        犬情報の部分更新
+        If-Matchが現在のETagと一致しない場合、412が返却されること
+        """
+        response = self.patch(
+            f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MAX}",
+            json={"color": 2},
+            headers={"If-Match": 'W/"1"'},
+        )
+        assert response.status_code == 412
+        assert DogModel.get(hash_key=OWNER_ID_1, range_key=DOG_ID_MAX).color == 1
+
+        response = self.patch(
+            f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MAX}",
+            json={"color": 2},
+            headers={"If-Match": 'W/"0"'},
+        )
+        assert response.status_code == 200
+
+    def test_patch_05(self):
+        """
+        犬情報の部分更新
+        同じ秒のうちに更新された場合も、以前のETagを指定したIf-Matchでは412が返却されること
+        """
+        response = self.get(f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MAX}")
+        etag = response.headers["etag"]
+
+        response = self.patch(
+            f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MAX}",
+            json={"color": 2},
+            headers={"If-Match": etag},
+        )
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+        response = self.patch(
+            f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MAX}",
+            json={"color": 3},
+            headers={"If-Match": etag},
+        )
+        assert response.status_code == 412
+        assert DogModel.get(hash_key=OWNER_ID_1, range_key=DOG_ID_MAX).color == 2
+
+    def test_patch_03(self):
+        """
+        犬情報の部分更新
+        存在しない犬情報の場合、404が返却され、データが作成されないこと
+        """
+        response = self.patch(
+            f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_NOT_EXIST}", json={"color": 2}
+        )
+        assert response.status_code == 404
+        assert response.json() == {"detail": "dog not found."}
+        ids = [x.dog_id for x in DogModel.query(hash_key=OWNER_ID_1)]
+        assert DOG_ID_NOT_EXIST not in ids
+
+    def test_patch_04(self):
+        """
+        犬情報の部分更新
+        名前を他の犬と同じ名前に変更した場合、400が返却されること
+        """
+        response = self.post(
+            f"/owners/{OWNER_ID_2}/dogs/", json={"name": "dog-a", "order": 1}
+        )
+        dog_id_a = response.json()["id"]
+        response = self.post(
+            f"/owners/{OWNER_ID_2}/dogs/", json={"name": "dog-b", "order": 2}
+        )
+        dog_id_b = response.json()["id"]
+
+        response = self.patch(
+            f"/owners/{OWNER_ID_2}/dogs/{dog_id_b}", json={"name": "dog-a"}
+        )
+        assert response.status_code == 400
+        assert response.json() == {"detail": "name is already exists."}
+
+        response = self.patch(
+            f"/owners/{OWNER_ID_2}/dogs/{dog_id_b}", json={"name": "dog-c"}
+        )
+        assert response.status_code == 200
+        assert response.json()["name"] == "dog-c"
+
+        self.delete(f"/owners/{OWNER_ID_2}/dogs/{dog_id_a}")
+        self.delete(f"/owners/{OWNER_ID_2}/dogs/{dog_id_b}")
+
+    def test_delete_01(self):
+        """
+        犬情報の削除
+        削除後、残りの犬情報の表示順が詰められること
+        """
+        gap_model = self.__create_model_min(
+            owner_id=OWNER_ID_1, dog_id=DOG_ID_GAP, updated_at=UPDATED_AT
+        )
+        gap_model.order = 3
+        gap_model.save()
+
+        response = self.delete(f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MIN}")
+        assert response.status_code == 200
+        assert response.json() == {}
+
+        models = {x.dog_id: x for x in DogModel.query(hash_key=OWNER_ID_1)}
+        assert DOG_ID_MIN not in models
+        assert models[DOG_ID_MAX].order == 1
+        assert models[DOG_ID_GAP].order == 2
+
+    def test_delete_02(self):
+        """
+        犬情報の削除
+        cascadeを指定した場合、犬情報に紐付くイベント情報のみ削除され、その件数が返却されること
+        """
+        events = [
+            EventModel(OWNER_ID_1, f"{i:032d}", timestamp=i, task_id="t", dog_id=dog_id)
+            for (i, dog_id) in enumerate([DOG_ID_MIN] * 30 + [DOG_ID_MAX])
+        ]
+        with EventModel.batch_write() as batch:
+            for event in events:
+                event.update_index_keys()
+                batch.save(event)
+        unique = UniqueModel.dog_name(OWNER_ID_1, f"{DOG_ID_MIN}-name")
+        unique.save()
+
+        response = self.delete(f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MIN}?cascade=true")
+        assert response.status_code == 200
+        assert response.json() == {"deleted_events": 30}
+
+        remains = [x.dog_id for x in EventModel.query(hash_key=OWNER_ID_1)]
+        assert remains == [DOG_ID_MAX]
+        assert UniqueModel.count(hash_key=unique.id) == 0
+        events[-1].delete()
+
+    def test_delete_03(self, monkeypatch):
+        """
+        犬情報の削除
+        トランザクションが失敗した場合、犬情報・犬名の予約のいずれも削除されず、再度削除できること
+        """
+        unique = UniqueModel.dog_name(OWNER_ID_1, f"{DOG_ID_MIN}-name")
+        unique.save()
+        transact_write = common.transact_write
+
+        @contextmanager
+        def failing_transact_write():
+            # 存在しないオーナーの確認を加え、トランザクション全体を失敗させる
+            with transact_write() as transaction:
+                yield transaction
+                transaction.condition_check(
+                    OwnerModel, OWNER_ID_3, condition=OwnerModel.id.exists()
+                )
+
+        monkeypatch.setattr(common, "transact_write", failing_transact_write)
+        with pytest.raises(TransactWriteError):
+            self.delete(f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MIN}")
+        assert DogModel.count(OWNER_ID_1, DogModel.dog_id == DOG_ID_MIN) == 1
+        assert UniqueModel.count(hash_key=unique.id) == 1
+
+        monkeypatch.undo()
+        response = self.delete(f"/owners/{OWNER_ID_1}/dogs/{DOG_ID_MIN}")
+        assert response.status_code == 200
+        assert DogModel.count(OWNER_ID_1, DogModel.dog_id == DOG_ID_MIN) == 0
+        assert UniqueModel.count(hash_key=unique.id) == 0
+
     def __create_model_min(self, owner_id: str, dog_id: str, updated_at: int):
         name = f"{dog_id}-name"
         return DogModel(
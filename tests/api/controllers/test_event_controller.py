@@ -1,13 +1,21 @@
+import gzip
+import json
 import os
 from typing import Optional
 
+import pytest
 from fastapi.testclient import TestClient
 from requests.models import Response
 
+from app.api.controllers import common, event_controller
 from app.api.main import app
+from app.models.event_model import EventModel
+from app.client_config import ModelMeta
 
 OWNER_ID_EXIST = "fdc8e0aaac134c6e87b299171f531103"
 OWNER_ID_NOT_EXIST = "zzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzz"
+DOG_ID_EXIST = "433845ff78964f24ad51752a24ccd529"
+TASK_ID_EXIST = "6fb697829c124aa28029419e934b06be"
 
 
 class TestEventCongroller:
@@ -22,6 +30,15 @@ class TestEventCongroller:
     def get(self, url: str, params: Optional[dict]) -> Response:
         return self.client.get(url, headers=self.headers, params=params)
 
+    def put(self, url: str, json: dict) -> Response:
+        return self.client.put(url, headers=self.headers, json=json)
+
+    def post(self, url: str, json: dict) -> Response:
+        return self.client.post(url, headers=self.headers, json=json)
+
+    def delete(self, url: str) -> Response:
+        return self.client.delete(url, headers=self.headers)
+
     def test_list_01(self):
         """一覧取得
         存在しないオーナーの場合、404が返却されること
@@ -62,3 +79,340 @@ class TestEventCongroller:
         assert body[1]["id"] == "d5c448961ac94a95b762efd5d504a92e"
         assert body[2]["id"] == "411c14d194434425aedc260dde8fa534"
         assert body[3]["id"] == "be65e6661f2d437d9a8274ea77659c59"
+
+    def test_list_04(self):
+        """一覧取得
+        limitを指定した場合、実施日時の昇順でページングされ、cursorで続きが取得できること
+        """
+        # -- exercise
+        ids = []
+        params = {"from": 1613259267, "to": 1613259867, "limit": 3}
+        while True:
+            response = self.get(f"/owners/{OWNER_ID_EXIST}/events/", params=params)
+            assert response.status_code == 200
+            ids.extend([x["id"] for x in response.json()])
+            if "x-next-cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["x-next-cursor"]
+        # -- verify
+        assert ids == [
+            "12b01d976cee4f23b2bdcea90a7312e0",
+            "411c14d194434425aedc260dde8fa534",
+            "be65e6661f2d437d9a8274ea77659c59",
+            "d5c448961ac94a95b762efd5d504a92e",
+        ]
+
+    def test_list_05(self):
+        """一覧取得
+        不正なcursorを指定した場合、400が返却されること
+        """
+        # -- exercise
+        params = {"from": 1613259267, "to": 1613259867, "cursor": "hoge"}
+        response = self.get(f"/owners/{OWNER_ID_EXIST}/events/", params=params)
+        # -- verify
+        assert response.status_code == 400
+        assert response.json() == {"detail": "illegal cursor."}
+
+    def test_list_06(self):
+        """一覧取得
+        Accept に application/x-ndjson を指定した場合、実施日時の昇順に1行1件で返却されること
+        """
+        # -- exercise
+        params = {"from": 1613259267, "to": 1613259867}
+        response = self.client.get(
+            f"/owners/{OWNER_ID_EXIST}/events/",
+            headers={**self.headers, "accept": "application/x-ndjson"},
+            params=params,
+        )
+        # -- verify
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = response.text.splitlines()
+        assert [json.loads(x)["id"] for x in lines] == [
+            "12b01d976cee4f23b2bdcea90a7312e0",
+            "411c14d194434425aedc260dde8fa534",
+            "be65e6661f2d437d9a8274ea77659c59",
+            "d5c448961ac94a95b762efd5d504a92e",
+        ]
+
+    def test_list_07(self):
+        """一覧取得
+        dog_idを指定した場合、その犬のイベント情報のみが実施日時の昇順で取得できること
+        """
+        # -- exercise
+        params = {
+            "from": 1613259267,
+            "to": 1613259867,
+            "dog_id": "f25105213e8541a7b1c43a30f71cc368",
+        }
+        response = self.get(f"/owners/{OWNER_ID_EXIST}/events/", params=params)
+        # -- verify
+        assert response.status_code == 200
+        assert [x["id"] for x in response.json()] == [
+            "411c14d194434425aedc260dde8fa534",
+            "be65e6661f2d437d9a8274ea77659c59",
+        ]
+
+    def test_list_08(self):
+        """一覧取得
+        task_idとlimitを指定した場合、そのタスクのイベント情報のみがページングされること
+        """
+        # -- exercise
+        ids = []
+        params = {
+            "from": 1613259267,
+            "to": 1613259867,
+            "task_id": TASK_ID_EXIST,
+            "limit": 1,
+        }
+        while True:
+            response = self.get(f"/owners/{OWNER_ID_EXIST}/events/", params=params)
+            assert response.status_code == 200
+            ids.extend([x["id"] for x in response.json()])
+            if "x-next-cursor" not in response.headers:
+                break
+            params["cursor"] = response.headers["x-next-cursor"]
+        # -- verify
+        assert ids == [
+            "411c14d194434425aedc260dde8fa534",
+            "d5c448961ac94a95b762efd5d504a92e",
+        ]
+
+    def test_patch_01(self):
+        """部分更新
+        犬IDを変更した場合、変更後の犬IDで絞り込んだ一覧から取得できること
+        """
+        # -- setup
+        url = f"/owners/{OWNER_ID_EXIST}/events/"
+        event = {
+            "timestamp": 1500000000,
+            "dog_id": DOG_ID_EXIST,
+            "task_id": TASK_ID_EXIST,
+        }
+        event_id = self.post(url, json=event).json()["id"]
+        dog_id = "f25105213e8541a7b1c43a30f71cc368"
+        # -- exercise
+        response = self.client.patch(
+            f"{url}{event_id}", headers=self.headers, json={"dog_id": dog_id}
+        )
+        # -- verify
+        assert response.status_code == 200
+        params = {"from": 1500000000, "to": 1500000000}
+        before = self.get(url, params={**params, "dog_id": DOG_ID_EXIST}).json()
+        after = self.get(url, params={**params, "dog_id": dog_id}).json()
+        assert before == []
+        assert [x["id"] for x in after] == [event_id]
+        # -- teardown
+        self.delete(f"{url}{event_id}")
+
+    def test_patch_02(self, monkeypatch):
+        """部分更新
+        犬ID・タスクID・実施日時を全て変更した場合、1回の更新で索引キーも書き換えられること
+        """
+        # -- setup
+        url = f"/owners/{OWNER_ID_EXIST}/events/"
+        event = {
+            "timestamp": 1500000000,
+            "dog_id": DOG_ID_EXIST,
+            "task_id": TASK_ID_EXIST,
+        }
+        event_id = self.post(url, json=event).json()["id"]
+        dog_id = "f25105213e8541a7b1c43a30f71cc368"
+        task_id = "0ae2bc405eb94b8f9e928a2689d99060"
+        updates = []
+        monkeypatch.setattr(EventModel, "update", lambda *x, **y: updates.append(y))
+        # -- exercise
+        response = self.client.patch(
+            f"{url}{event_id}",
+            headers=self.headers,
+            json={"dog_id": dog_id, "task_id": task_id, "timestamp": 1500000001},
+        )
+        # -- verify
+        assert response.status_code == 200
+        assert updates == []
+        params = {"from": 1500000001, "to": 1500000001}
+        by_dog = self.get(url, params={**params, "dog_id": dog_id}).json()
+        by_task = self.get(url, params={**params, "task_id": task_id}).json()
+        assert [x["id"] for x in by_dog] == [event_id]
+        assert [x["id"] for x in by_task] == [event_id]
+        # -- teardown
+        self.delete(f"{url}{event_id}")
+
+    def test_post_01(self):
+        """登録
+        削除された犬情報を参照するイベントは、キャッシュ済みであっても400が返却されること
+        """
+        # -- setup
+        dog = self.post(
+            f"/owners/{OWNER_ID_EXIST}/dogs/", json={"name": "キャッシュ", "order": 9}
+        ).json()
+        event = {"timestamp": 1500000000, "dog_id": dog["id"], "task_id": TASK_ID_EXIST}
+        created = self.post(f"/owners/{OWNER_ID_EXIST}/events/", json=event)
+        assert created.status_code == 201
+        self.delete(f"/owners/{OWNER_ID_EXIST}/events/{created.json()['id']}")
+        # -- exercise
+        self.delete(f"/owners/{OWNER_ID_EXIST}/dogs/{dog['id']}")
+        response = self.post(f"/owners/{OWNER_ID_EXIST}/events/", json=event)
+        # -- verify
+        assert response.status_code == 400
+        assert response.json() == {"detail": "illegal dog id."}
+
+    def test_post_batch_01(self):
+        """一括登録
+        不正な犬ID・タスクIDを含むものを除いて登録され、リクエスト順に登録結果が返却されること
+        """
+        # -- exercise
+        event = {
+            "timestamp": 1500000000,
+            "dog_id": DOG_ID_EXIST,
+            "task_id": TASK_ID_EXIST,
+        }
+        events = [
+            *[event] * 30,
+            {**event, "dog_id": OWNER_ID_NOT_EXIST},
+            {**event, "task_id": OWNER_ID_NOT_EXIST},
+        ]
+        response = self.post(
+            f"/owners/{OWNER_ID_EXIST}/events/batch", json={"events": events}
+        )
+        body = response.json()
+        # -- verify
+        assert response.status_code == 200
+        assert [x["status"] for x in body] == [201] * 30 + [400, 400]
+        assert body[30] == {"status": 400, "detail": "illegal dog id."}
+        assert body[31] == {"status": 400, "detail": "illegal task id."}
+        params = {"from": 1500000000, "to": 1500000000}
+        listed = self.get(f"/owners/{OWNER_ID_EXIST}/events/", params=params).json()
+        assert sorted(x["id"] for x in listed) == sorted(
+            x["event"]["id"] for x in body[:30]
+        )
+        # -- teardown
+        for x in listed:
+            self.delete(f"/owners/{OWNER_ID_EXIST}/events/{x['id']}")
+
+    def test_post_batch_02(self):
+        """一括登録
+        件数が上限を超えた場合、422が返却されること
+        """
+        # -- exercise
+        event = {
+            "timestamp": 1500000000,
+            "dog_id": DOG_ID_EXIST,
+            "task_id": TASK_ID_EXIST,
+        }
+        response = self.post(
+            f"/owners/{OWNER_ID_EXIST}/events/batch", json={"events": [event] * 501}
+        )
+        # -- verify
+        assert response.status_code == 422
+
+    def test_post_batch_03(self, monkeypatch):
+        """一括登録
+        犬ID・タスクIDの確認が再送の上限まで未処理の場合、登録せずに503が返却されること
+        """
+        # -- setup
+        calls = []
+
+        def dispatch(operation_name, operation_kwargs):
+            calls.append(operation_kwargs)
+            return {
+                "Responses": {},
+                "UnprocessedKeys": operation_kwargs["RequestItems"],
+            }
+
+        monkeypatch.setattr(common.connection, "dispatch", dispatch)
+        monkeypatch.setattr(common.time, "sleep", lambda x: None)
+        event = {
+            "timestamp": 1500000000,
+            "dog_id": OWNER_ID_NOT_EXIST,
+            "task_id": TASK_ID_EXIST,
+        }
+        # -- exercise
+        response = self.post(
+            f"/owners/{OWNER_ID_EXIST}/events/batch", json={"events": [event]}
+        )
+        # -- verify
+        assert response.status_code == 503
+        assert response.json() == {"detail": "references could not be verified."}
+        assert len(calls) == ModelMeta.max_retry_attempts
+
+    def test_stats_01(self):
+        """集計取得
+        登録・更新・削除に応じて件数が増減し、集計単位ごとに合算されること
+        """
+        # -- setup
+        # 2017-07-14, 2017-07-15 (JST)
+        day1, day2 = 1500000000, 1500086400
+        event = {"timestamp": day1, "dog_id": DOG_ID_EXIST, "task_id": TASK_ID_EXIST}
+        url = f"/owners/{OWNER_ID_EXIST}/events/"
+        ids = [self.post(url, json=event).json()["id"] for _ in range(3)]
+        self.put(f"{url}{ids[0]}", json={**event, "timestamp": day2})
+        self.delete(f"{url}{ids[1]}")
+        # -- exercise
+        params = {"from": day1, "to": day2}
+        daily = self.get(f"{url}stats", params=params).json()
+        monthly = self.get(f"{url}stats", params={**params, "granularity": "month"})
+        # -- verify
+        keys = {"dog_id": DOG_ID_EXIST, "task_id": TASK_ID_EXIST}
+        assert daily == [
+            {"bucket": "2017-07-14", **keys, "count": 1},
+            {"bucket": "2017-07-15", **keys, "count": 1},
+        ]
+        assert monthly.json() == [{"bucket": "2017-07", **keys, "count": 2}]
+        # -- teardown
+        for event_id in ids:
+            self.delete(f"{url}{event_id}")
+
+    def test_export_01(self):
+        """エクスポート
+        csv.gz を指定した場合、実施日時の昇順のCSVがgzip圧縮されて返却されること
+        """
+        # -- exercise
+        params = {"format": "csv.gz", "from": 1613259267, "to": 1613259867}
+        response = self.get(f"/owners/{OWNER_ID_EXIST}/events/export", params=params)
+        # -- verify
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/gzip"
+        lines = gzip.decompress(response.content).decode().splitlines()
+        assert lines[0] == "id,timestamp,dog_id,task_id,updated_at"
+        assert lines[1] == (
+            "12b01d976cee4f23b2bdcea90a7312e0,1613259267,"
+            "433845ff78964f24ad51752a24ccd529,0ae2bc405eb94b8f9e928a2689d99060,1613259179"
+        )
+        assert len(lines) == 5
+
+    def test_export_03(self, monkeypatch):
+        """エクスポート
+        ファイルが大きく、配置先のS3バケットが未設定の場合、500が返却されること
+        """
+        # -- setup
+        monkeypatch.setattr(event_controller, "EXPORT_INLINE_MAX_BYTES", 0)
+        monkeypatch.setattr(event_controller, "EXPORT_BUCKET", None)
+        # -- exercise
+        params = {"format": "csv.gz", "from": 1613259267, "to": 1613259867}
+        response = self.get(f"/owners/{OWNER_ID_EXIST}/events/export", params=params)
+        # -- verify
+        assert response.status_code == 500
+        assert response.json() == {"detail": "export bucket is not configured."}
+
+    def test_export_02(self):
+        """エクスポート
+        arrow を指定した場合、犬ID・タスクIDが辞書エンコードされたArrowファイルが返却されること
+        """
+        pyarrow = pytest.importorskip("pyarrow.ipc")
+        # -- exercise
+        params = {"format": "arrow", "from": 1613259267, "to": 1613259867}
+        response = self.get(f"/owners/{OWNER_ID_EXIST}/events/export", params=params)
+        # -- verify
+        assert response.status_code == 200
+        table = pyarrow.open_file(response.content).read_all()
+        assert table.column("timestamp").to_pylist() == [
+            1613259267,
+            1613259367,
+            1613259467,
+            1613259867,
+        ]
+        assert table.column("dog_id").chunk(0).dictionary.to_pylist() == [
+            "433845ff78964f24ad51752a24ccd529",
+            "f25105213e8541a7b1c43a30f71cc368",
+        ]
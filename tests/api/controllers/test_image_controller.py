@@ -0,0 +1,314 @@
+import base64
+import io
+import json
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+from botocore.utils import parse_timestamp
+from fastapi.testclient import TestClient
+from requests.models import Response
+
+from app import image
+from app.api.controllers import image_controller
+from app.api.controllers.image_controller import (
+    IMAGE_BUCKET,
+    IMAGE_CACHE_CONTROL,
+    IMAGE_MAX_BYTES,
+    image_headers,
+    image_url_cache,
+    is_valid_image,
+)
+from app.api.main import app
+from app.client_config import S3_HOST, s3_client
+from app.models.owner_model import OwnerModel
+
+OWNER_ID_1 = "00000000000000000000000000000000"
+OWNER_ID_NOT_EXIST = "99999999999999999999999999999999"
+IMAGE_PATH = "20201101/12/0123456789abcdef0123456789abcdef.png"
+IMAGE_DATA = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+# 画像データの取得は S3 互換のエンドポイント(S3_ENDPOINT)がある場合のみ確認する
+requires_s3 = pytest.mark.skipif(S3_HOST is None, reason="S3_ENDPOINT is not set")
+
+
+def put_image(image_path: str, data: bytes) -> None:
+    client = s3_client()
+    try:
+        client.head_bucket(Bucket=IMAGE_BUCKET)
+    except ClientError:
+        client.create_bucket(
+            Bucket=IMAGE_BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": client.meta.region_name},
+        )
+    client.put_object(Bucket=IMAGE_BUCKET, Key=f"{OWNER_ID_1}/{image_path}", Body=data)
+
+
+def new_image_path(Image) -> str:
+    """縮小画像の生成元として、400x200 の PNG を新しい画像パスに保存する"""
+    output = io.BytesIO()
+    Image.new("RGB", (400, 200), (200, 100, 50)).save(output, format="PNG")
+    image_path = f"20201101/12/{uuid.uuid4().hex}.png"
+    put_image(image_path, output.getvalue())
+    return image_path
+
+
+class TestImageController:
+    @classmethod
+    def setup_class(cls):
+        os.environ["LOG_LEVEL"] = "WARNING"
+        try:
+            OwnerModel.get(hash_key=OWNER_ID_1)
+        except OwnerModel.DoesNotExist:
+            owner = OwnerModel(id=OWNER_ID_1)
+            owner.email = "user1@test.com"
+            owner.save()
+
+    def setup_method(self):
+        self.client = TestClient(app)
+        self.headers = {"x-api-key": "hogehoge"}
+        image_url_cache.clear()
+
+    def post(self, url: str, json: dict) -> Response:
+        return self.client.post(url, headers=self.headers, json=json)
+
+    def get(self, url: str, headers: dict = {}) -> Response:
+        return self.client.get(
+            url, headers={**self.headers, **headers}, allow_redirects=False
+        )
+
+    def test_get_01(self):
+        """
+        画像データの取得URL
+        有効期限付きのURLが返却され、期限切れ間際まで同じURLが返却されること
+        """
+        url = f"/owners/{OWNER_ID_1}/images/?image_path={IMAGE_PATH}"
+
+        response = self.get(f"{url}&delivery=url")
+        assert response.status_code == 200
+        body = response.json()
+        assert f"/{OWNER_ID_1}/{IMAGE_PATH}?" in body["url"]
+        assert "Signature=" in body["url"] or "X-Amz-Signature=" in body["url"]
+
+        response = self.get(url, headers={"Accept": "application/json"})
+        assert response.status_code == 200
+        assert response.json() == body
+        assert response.headers["vary"] == "Accept"
+        assert image_url_cache.stats()["hits"] == 1
+
+    def test_get_02(self):
+        """
+        画像データの取得URLへのリダイレクト
+        """
+        url = f"/owners/{OWNER_ID_1}/images/?image_path={IMAGE_PATH}"
+        expected = self.get(f"{url}&delivery=url").json()["url"]
+
+        response = self.get(f"{url}&delivery=redirect")
+        assert response.status_code == 302
+        assert response.headers["location"] == expected
+        assert response.headers["cache-control"].startswith("private, max-age=")
+        assert response.headers["vary"] == "Accept"
+
+    def test_get_03(self):
+        """
+        画像データの取得URL
+        オーナーが存在しない場合はURLを返却しないこと
+        """
+        url = f"/owners/{OWNER_ID_NOT_EXIST}/images/?image_path={IMAGE_PATH}"
+
+        response = self.get(f"{url}&delivery=url")
+        assert response.status_code == 404
+        assert response.json() == {"detail": "owner not found."}
+        assert image_url_cache.stats()["size"] == 0
+
+    def test_post_upload_01(self):
+        """
+        画像ファイルのアップロード先の発行
+        content-type とサイズを条件とした署名付きPOSTが発行されること
+        """
+        response = self.post(
+            f"/owners/{OWNER_ID_1}/images/uploads", {"content_type": "image/png"}
+        )
+        assert response.status_code == 201
+        body = response.json()
+        assert re.match(r"^[0-9]{8}/[0-9]{2}/[a-z0-9]{32}\.png$", body["image_path"])
+        assert body["form_fields"]["key"] == f"{OWNER_ID_1}/{body['image_path']}"
+        assert body["form_fields"]["Content-Type"] == "image/png"
+        policy = json.loads(base64.b64decode(body["form_fields"]["policy"]))
+        assert {"Content-Type": "image/png"} in policy["conditions"]
+        assert ["content-length-range", 1, IMAGE_MAX_BYTES] in policy["conditions"]
+
+    def test_post_upload_02(self):
+        """
+        画像ファイルのアップロード先の発行
+        対象外の content-type は受け付けないこと
+        """
+        response = self.post(
+            f"/owners/{OWNER_ID_1}/images/uploads", {"content_type": "image/svg+xml"}
+        )
+        assert response.status_code == 422
+
+    def test_is_valid_image_01(self):
+        """
+        画像ファイルの検証
+        画像パスの拡張子とファイル先頭のバイト列が一致する場合のみ有効とすること
+        """
+        assert is_valid_image("20201101/12/a.png", b"\x89PNG\r\n\x1a\n\x00")
+        assert is_valid_image("20201101/12/a.gif", b"GIF89a\x00")
+        assert is_valid_image("20201101/12/a.jpeg", b"\xff\xd8\xff\xe0")
+        assert not is_valid_image("20201101/12/a.png", b"\xff\xd8\xff\xe0")
+        assert not is_valid_image("20201101/12/a.svg", b"<svg")
+
+    def test_image_headers_01(self):
+        """
+        画像データのレスポンスヘッダ
+        S3 のオブジェクト情報から ETag・Last-Modified・Content-Range が設定されること
+        """
+        headers = image_headers(
+            {
+                "ETag": '"0123456789abcdef"',
+                "LastModified": datetime(2020, 11, 1, 3, 4, 5, tzinfo=timezone.utc),
+                "ContentRange": "bytes 0-99/1000",
+            }
+        )
+        assert headers == {
+            "Cache-Control": IMAGE_CACHE_CONTROL,
+            "Accept-Ranges": "bytes",
+            "Vary": "Accept",
+            "ETag": '"0123456789abcdef"',
+            "Last-Modified": "Sun, 01 Nov 2020 03:04:05 GMT",
+            "Content-Range": "bytes 0-99/1000",
+        }
+
+        # botocore が返却する日時(dateutil の tzutc)
+        headers = image_headers(
+            {"LastModified": parse_timestamp("2020-11-01T03:04:05.000Z")}
+        )
+        assert headers["Last-Modified"] == "Sun, 01 Nov 2020 03:04:05 GMT"
+
+    @requires_s3
+    def test_get_binary_01(self):
+        """
+        画像データの取得
+        画像データが ETag・Last-Modified・長期間のキャッシュ指定付きで返却されること
+        """
+        put_image(IMAGE_PATH, IMAGE_DATA)
+        url = f"/owners/{OWNER_ID_1}/images/?image_path={IMAGE_PATH}"
+
+        response = self.get(url)
+        assert response.status_code == 200
+        assert response.content == IMAGE_DATA
+        assert response.headers["content-type"] == "image/png"
+        assert response.headers["cache-control"] == IMAGE_CACHE_CONTROL
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["etag"]
+        assert response.headers["last-modified"].endswith(" GMT")
+        assert response.headers["vary"] == "Accept"
+
+    @requires_s3
+    def test_get_binary_02(self):
+        """
+        画像データの条件付き取得
+        If-None-Match・If-Modified-Since に一致する場合は 304 が返却されること
+        """
+        put_image(IMAGE_PATH, IMAGE_DATA)
+        url = f"/owners/{OWNER_ID_1}/images/?image_path={IMAGE_PATH}"
+        response = self.get(url)
+        etag = response.headers["etag"]
+        last_modified = response.headers["last-modified"]
+
+        response = self.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        response = self.get(url, headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        response = self.get(url, headers={"If-None-Match": '"0"'})
+        assert response.status_code == 200
+        assert response.content == IMAGE_DATA
+
+    @requires_s3
+    def test_get_binary_03(self):
+        """
+        画像データの部分取得
+        Range の範囲が返却され、範囲外の場合は 416 が返却されること
+        """
+        put_image(IMAGE_PATH, IMAGE_DATA)
+        url = f"/owners/{OWNER_ID_1}/images/?image_path={IMAGE_PATH}"
+
+        response = self.get(url, headers={"Range": "bytes=0-7"})
+        assert response.status_code == 206
+        assert response.content == IMAGE_DATA[:8]
+        assert response.headers["content-range"] == f"bytes 0-7/{len(IMAGE_DATA)}"
+
+        response = self.get(url, headers={"Range": "bytes=100000-"})
+        assert response.status_code == 416
+        assert response.json() == {"detail": "range is not satisfiable."}
+
+    def test_get_variant_01(self, monkeypatch):
+        """
+        縮小画像の取得
+        Pillow が利用できない環境では、サーバー側の問題として 501 が返却されること
+        """
+        monkeypatch.setattr(image, "supported", lambda: False)
+        url = f"/owners/{OWNER_ID_1}/images/?image_path={IMAGE_PATH}&variant=thumb"
+
+        response = self.get(url)
+        assert response.status_code == 501
+        assert response.json() == {"detail": "variant is not available."}
+
+    @requires_s3
+    def test_get_variant_02(self, monkeypatch):
+        """
+        縮小画像の取得
+        初回は縮小画像を生成して保存し、2回目以降は保存済みの縮小画像が返却されること
+        """
+        Image = pytest.importorskip("PIL.Image")
+        image_path = new_image_path(Image)
+        url = f"/owners/{OWNER_ID_1}/images/?image_path={image_path}&variant=thumb"
+        headers = {"Accept": "image/webp,image/*"}
+        # Pillow が WebP に対応していない場合は JPEG
+        format = image.output_format(headers["Accept"])
+
+        response = self.get(url, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == image.MEDIA_TYPES[format]
+        assert response.headers["vary"] == "Accept"
+        with Image.open(io.BytesIO(response.content)) as resized:
+            assert resized.size == (128, 64)
+        key = image.variant_key(f"{OWNER_ID_1}/{image_path}", 128, format)
+        s3_client().head_object(Bucket=IMAGE_BUCKET, Key=key)
+
+        # 保存済みの縮小画像は生成し直さない
+        def create_variant(*args):
+            raise AssertionError("variant is created again")
+
+        monkeypatch.setattr(image_controller, "create_variant", create_variant)
+        second = self.get(url, headers=headers)
+        assert second.status_code == 200
+        assert second.content == response.content
+
+    @requires_s3
+    def test_get_variant_03(self):
+        """
+        縮小画像の取得URL
+        縮小画像を生成・保存し、その取得URLが返却されること
+        """
+        Image = pytest.importorskip("PIL.Image")
+        image_path = new_image_path(Image)
+        url = f"/owners/{OWNER_ID_1}/images/?image_path={image_path}&w=100"
+
+        response = self.get(f"{url}&delivery=url")
+        assert response.status_code == 200
+        key = image.variant_key(f"{OWNER_ID_1}/{image_path}", 128, image.JPEG)
+        assert f"/{key}?" in response.json()["url"]
+        obj = s3_client().get_object(Bucket=IMAGE_BUCKET, Key=key)
+        assert obj["ContentType"] == "image/jpeg"
+        with Image.open(io.BytesIO(obj["Body"].read())) as resized:
+            assert resized.size == (128, 64)
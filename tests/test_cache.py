@@ -0,0 +1,57 @@
+import time
+
+from app.cache import TTLCache
+
+
+class TestTTLCache:
+    def test_get_01(self):
+        """
+        キャッシュの取得
+        登録済みのキーはヒット、未登録のキーはミスとして計上されること
+        """
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", True)
+        cache.set("b", False)
+
+        assert cache.get("a") is True
+        assert cache.get("b") is False
+        assert cache.get("c") is None
+        assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 1}
+
+    def test_get_02(self):
+        """
+        キャッシュの取得
+        TTLを経過したエントリは取得できないこと
+        """
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", True, ttl=0.01)
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
+        assert cache.stats()["size"] == 0
+
+    def test_set_01(self):
+        """
+        キャッシュの登録
+        上限を超えた場合、最も古く参照されたエントリが破棄されること
+        """
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_invalidate_01(self):
+        """
+        キャッシュの破棄
+        破棄したエントリは取得できないこと
+        """
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", False)
+        cache.invalidate("a")
+
+        assert cache.get("a") is None
@@ -0,0 +1,57 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from app.api.main import app
+from app.client_config import PoolStats
+from app.models import connection
+from app.models.connection import MODELS
+
+
+class TestPoolStats:
+    def test_acquire_01(self):
+        """
+        同時リクエスト数の計測
+        接続プールの上限に達した状態で開始したリクエストが saturated として計上されること
+        """
+        stats = PoolStats(maxsize=2)
+        stats.acquire()
+        stats.acquire()
+        stats.acquire()
+        stats.release()
+        stats.release()
+
+        assert stats.stats() == {
+            "maxsize": 2,
+            "requests": 3,
+            "in_use": 1,
+            "peak": 3,
+            "saturated": 1,
+        }
+
+
+class TestWarmUp:
+    @classmethod
+    def setup_class(cls):
+        os.environ["LOG_LEVEL"] = "WARNING"
+
+    def test_startup_01(self, monkeypatch):
+        """
+        起動時の接続確立
+        各モデルと共有コネクションでリクエストが送信され、/status に計測値が含まれること
+        """
+        # 先に実行されたテストで接続の確立・テーブル定義の取得が済んでいる場合があるため、未実行の状態に戻す
+        monkeypatch.setattr(connection, "warmed_up", False)
+        monkeypatch.setattr(connection.connection, "_tables", {})
+        for x in MODELS:
+            monkeypatch.setattr(x._get_connection().connection, "_tables", {})
+
+        with TestClient(app) as client:
+            response = client.get("/status")
+
+        assert response.status_code == 200
+        pools = response.json()["pools"]
+        for name in [x.__name__ for x in MODELS] + ["Connection"]:
+            assert pools[name]["requests"] >= 1
+            assert pools[name]["in_use"] == 0
+            assert pools[name]["maxsize"] == 20
@@ -0,0 +1,78 @@
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+from app.api.compression import SelectiveGZipMiddleware, accepts_gzip
+
+BODY = b"0" * 2000
+
+app = FastAPI()
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=1000)
+
+
+@app.get("/text")
+def text():
+    return Response(BODY, media_type="text/plain")
+
+
+@app.get("/image")
+def image():
+    return Response(BODY, media_type="image/png")
+
+
+@app.get("/archive")
+def archive():
+    return Response(BODY, media_type="application/gzip")
+
+
+@app.get("/partial")
+def partial():
+    return Response(
+        BODY,
+        status_code=206,
+        media_type="text/plain",
+        headers={"Content-Range": "bytes 0-1999/4000"},
+    )
+
+
+class TestSelectiveGZipMiddleware:
+    def test_gzip_01(self):
+        """
+        レスポンスの圧縮
+        画像データ、圧縮形式のファイル、部分取得のレスポンスは圧縮されないこと
+        """
+        client = TestClient(app)
+
+        response = client.get("/text")
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.content == BODY
+
+        for url in ["/image", "/archive", "/partial"]:
+            response = client.get(url)
+            assert "content-encoding" not in response.headers
+            assert response.headers["content-length"] == str(len(BODY))
+            assert response.content == BODY
+
+    def test_gzip_02(self):
+        """
+        レスポンスの圧縮
+        Accept-Encoding で gzip が q=0 とされた場合は圧縮されないこと
+        """
+        client = TestClient(app)
+
+        response = client.get("/text", headers={"Accept-Encoding": "gzip;q=0"})
+        assert "content-encoding" not in response.headers
+        assert response.content == BODY
+
+    def test_accepts_gzip_01(self):
+        """
+        Accept-Encoding の判定
+        q 値が 0 の場合は受け付けず、* は gzip の指定がない場合のみ適用されること
+        """
+        assert accepts_gzip("gzip")
+        assert accepts_gzip("deflate, gzip;q=0.5")
+        assert accepts_gzip("*")
+        assert not accepts_gzip("")
+        assert not accepts_gzip("identity")
+        assert not accepts_gzip("gzip;q=0")
+        assert not accepts_gzip("GZIP; q=0.0, *")
+        assert not accepts_gzip("*;q=0")
@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+from app import image
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def create_image(mode: str, size, format: str) -> bytes:
+    output = io.BytesIO()
+    color = {"RGBA": (200, 100, 50, 128), "RGB": (200, 100, 50), "L": 200}[mode]
+    Image.new(mode, size, color).save(output, format=format)
+    return output.getvalue()
+
+
+class TestImage:
+    def test_variant_width_01(self):
+        """
+        縮小画像の幅
+        variant は定義済みの幅、w は定義済みの幅のいずれかに切り上げられること
+        """
+        assert image.variant_width(None, None) is None
+        assert image.variant_width("thumb", None) == 128
+        assert image.variant_width(None, 100) == 128
+        assert image.variant_width(None, 128) == 128
+        assert image.variant_width(None, 5000) == image.WIDTHS[-1]
+
+    def test_resize_01(self):
+        """
+        縮小画像の生成
+        長辺が指定の幅に縮小され、透過画像は JPEG では白背景に合成されること
+        """
+        data = create_image("RGB", (1600, 1200), "JPEG")
+        for format in [image.WEBP, image.JPEG]:
+            with Image.open(io.BytesIO(image.resize(data, 128, format))) as resized:
+                assert resized.format == format.upper()
+                assert resized.size == (128, 96)
+
+        data = create_image("RGBA", (300, 600), "PNG")
+        with Image.open(io.BytesIO(image.resize(data, 64, image.JPEG))) as resized:
+            assert resized.mode == "RGB"
+            assert resized.size == (32, 64)
+
+    def test_resize_02(self):
+        """
+        縮小画像の生成
+        画素数が上限を超える画像、画像以外のデータは展開せずにエラーとすること
+        """
+        data = create_image("L", (10, 10), "PNG")
+        original = image.MAX_PIXELS
+        image.MAX_PIXELS = 99
+        try:
+            with pytest.raises(image.InvalidImageError):
+                image.resize(data, 64, image.JPEG)
+        finally:
+            image.MAX_PIXELS = original
+
+        with pytest.raises(image.InvalidImageError):
+            image.resize(b"<svg></svg>", 64, image.JPEG)
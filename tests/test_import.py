@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+DEFERRED_MODULES = ["boto3", "pyarrow", "PIL"]
+
+
+class TestImport:
+    def test_deferred_01(self):
+        """
+        アプリケーションの import
+        初回の利用時に読み込むモジュールが起動時に import されないこと
+        """
+        code = (
+            "import sys, app.api.main; "
+            f"print(','.join(x for x in {DEFERRED_MODULES!r} if x in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            stdout=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+        )
+
+        assert result.stdout.strip() == ""
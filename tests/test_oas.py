@@ -0,0 +1,40 @@
+import gzip
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.main import app
+from app.api.openapi import OAS_PATH, PrebuiltOpenAPIMiddleware, dumps, generate
+
+
+class TestOpenAPI:
+    def test_document_01(self):
+        """
+        生成済みのOpenAPIドキュメント
+        oas/bow.json がルート定義から生成した内容と一致すること
+        (不一致の場合は python scripts/build_oas.py で再生成する)
+        """
+        assert OAS_PATH.read_text(encoding="utf-8") == dumps(generate(app))
+
+    def test_prebuilt_01(self):
+        """
+        生成済みのOpenAPIドキュメントの配信
+        gzip を受け付ける場合は圧縮済みのバイト列が返却されること
+        """
+        client = TestClient(PrebuiltOpenAPIMiddleware(FastAPI(openapi_url=None)))
+
+        response = client.get("/openapi.json", stream=True)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.headers["content-encoding"] == "gzip"
+        document = gzip.decompress(response.raw.read(decode_content=False))
+        assert json.loads(document) == json.loads(OAS_PATH.read_bytes())
+
+        for encoding in ["identity", "gzip;q=0, identity"]:
+            response = client.get(
+                "/openapi.json", headers={"Accept-Encoding": encoding}
+            )
+            assert response.status_code == 200
+            assert "content-encoding" not in response.headers
+            assert response.json() == json.loads(OAS_PATH.read_bytes())